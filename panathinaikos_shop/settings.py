@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+from datetime import timedelta
 from pathlib import Path
 import os
 
@@ -48,7 +49,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'shop.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'shop.middleware.PrimaryPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -61,7 +64,8 @@ ROOT_URLCONF = 'panathinaikos_shop.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates with render timing (see shop/metrics.py)
+        'BACKEND': 'shop.metrics.TimedDjangoTemplates',
         'DIRS': [
             os.path.join(BASE_DIR, 'shop', 'templates'),
         ],
@@ -72,6 +76,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'shop.context_processors.cart',
             ],
         },
     },
@@ -83,13 +88,73 @@ WSGI_APPLICATION = 'panathinaikos_shop.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# SQLite by default, DJANGO_DB_ENGINE/DJANGO_DB_NAME (plus DJANGO_DB_USER,
+# DJANGO_DB_PASSWORD, DJANGO_DB_HOST, DJANGO_DB_PORT) select another backend
+
+DB_ENGINE = os.environ.get('DJANGO_DB_ENGINE', 'django.db.backends.sqlite3')
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'ENGINE': DB_ENGINE,
+        'NAME': os.environ.get('DJANGO_DB_NAME', BASE_DIR / 'db.sqlite3'),
+        'USER': os.environ.get('DJANGO_DB_USER', ''),
+        'PASSWORD': os.environ.get('DJANGO_DB_PASSWORD', ''),
+        'HOST': os.environ.get('DJANGO_DB_HOST', ''),
+        'PORT': os.environ.get('DJANGO_DB_PORT', ''),
+        # Keep connections open between requests, checked before reuse
+        'CONN_MAX_AGE': int(os.environ.get('DJANGO_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
     }
 }
+if DB_ENGINE == 'django.db.backends.sqlite3':
+    # Take the write lock when the transaction starts, so busy_timeout
+    # applies instead of failing when a read lock can't be upgraded
+    DATABASES['default']['OPTIONS']['transaction_mode'] = 'IMMEDIATE'
+
+# Read replica (see shop/routers.py). Locally, two SQLite files work:
+#   cp db.sqlite3 replica.sqlite3 && DJANGO_REPLICA_NAME=replica.sqlite3 python manage.py runserver
+# Only the catalog views read from it (shop.routers.REPLICA_VIEWS, SHOP_REPLICA_VIEWS to
+# override). The test suite runs without it.
+if os.environ.get('DJANGO_REPLICA_NAME'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['DJANGO_REPLICA_NAME'],
+        'HOST': os.environ.get('DJANGO_REPLICA_HOST', DATABASES['default']['HOST']),
+        'TEST': {'MIRROR': 'default'},
+    }
 
+DATABASE_ROUTERS = ['shop.routers.PrimaryReplicaRouter']
+SHOP_REPLICA_DATABASE = 'replica' if 'replica' in DATABASES else None
+#Seconds a client keeps reading from the primary after a write
+SHOP_REPLICA_STICKY_SECONDS = 5
+
+#SQLite pragmas run on every new connection (see shop/db.py)
+SHOP_SQLITE_PRAGMAS = {
+    'busy_timeout': 5000,
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'cache_size': -20000,
+    'mmap_size': 128 * 1024 * 1024,
+    'temp_store': 'memory',
+}
+
+
+# Cache
+# locmem by default, point DJANGO_CACHE_BACKEND/DJANGO_CACHE_LOCATION at a
+# file or memcached cache in production (e.g. FileBasedCache + a directory,
+# PyMemcacheCache + host:port). locmem is private to each process, so it is
+# not used for sessions: with several workers a logout or a session cart
+# change in one would leave stale copies in the others. The session engine
+# only defaults to cached_db once a shared backend is configured (see below)
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', 'panathinaikos-shop'),
+    }
+}
+SHARED_CACHE = not CACHES['default']['BACKEND'].endswith(('LocMemCache', 'DummyCache'))
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -145,4 +210,86 @@ SECURE_BROWSER_XSS_FILTER = True
 X_FRAME_OPTIONS = 'DENY'
 SECURE_CONTENT_TYPE_NOSNIFF = True
 CSRF_COOKIE_HTTPONLY = True
-SESSION_COOKIE_HTTPONLY = True
\ No newline at end of file
+SESSION_COOKIE_HTTPONLY = True
+
+#Sessions: 'cached_db', 'db', 'cache' or 'signed_cookies', set per environment
+#with DJANGO_SESSION_ENGINE. cached_db reads sessions from the cache and only
+#touches django_session on writes; signed_cookies never does. The default is
+#cached_db with a shared cache and db with the per-process locmem one, where
+#cached_db/cache sessions go stale between workers (see CACHES).
+#Expired db sessions are removed by `manage.py run_maintenance` (cron)
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + os.environ.get(
+    'DJANGO_SESSION_ENGINE', 'cached_db' if SHARED_CACHE else 'db')
+#Flash messages in a signed cookie so they don't write to the session
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
+#Buffered product view counter (see shop/counters.py)
+SHOP_VIEW_COUNTER = {
+    'THRESHOLD': 100,
+    'INTERVAL': 30,
+}
+
+#Buffered view history ingestion and retention (see shop/counters.py)
+SHOP_VIEW_HISTORY = {
+    'THRESHOLD': 200,
+    'INTERVAL': 30,
+    'RETENTION_DAYS': 90,
+}
+
+#Rendered product card fragments (see shop/fragments.py)
+SHOP_FRAGMENT_CACHE = 'default'
+SHOP_FRAGMENT_CACHE_TIMEOUT = 60 * 60
+
+#Catalog pagination: 'offset' (page numbers) or 'cursor' (keyset, see shop/pagination.py)
+SHOP_CATALOG_PAGINATION = 'offset'
+SHOP_CATALOG_COUNT_TIMEOUT = 5 * 60
+SHOP_FACET_CACHE_TIMEOUT = 5 * 60
+
+#Trending/bestseller rankings of the home page (see shop/rankings.py), update_rankings
+#runs from cron and skips until REFRESH_INTERVAL seconds have passed. Orders are counted
+#once they are ORDER_LAG seconds old, update_rankings --rebuild recounts them all
+SHOP_RANKINGS = {
+    'REFRESH_INTERVAL': 5 * 60,
+    'TRENDING_HALF_LIFE': timedelta(days=3),
+    'BESTSELLER_HALF_LIFE': timedelta(days=30),
+    'WEIGHTS': {'views': 1.0, 'ratings': 5.0, 'orders': 10.0},
+    'ORDER_LAG': 60,
+}
+
+#Similar products (see shop/recommendations.py), rebuilt by build_recommendations
+SHOP_RECOMMENDATIONS = {
+    'TOP_K': 8,
+    'MAX_BASKET': 30,
+    'ATTRIBUTE_WEIGHT': 0.25,
+    'BASKETS': {'orders': 3.0, 'wishlists': 2.0, 'views': 1.0},
+}
+
+#Staff sales report (see shop/reports.py), /staff/sales/ counts the new orders at most
+#every REFRESH_INTERVAL seconds, run_maintenance too. Orders are counted once they are
+#ORDER_LAG seconds old, update_sales_report --rebuild recounts them all
+SHOP_SALES_REPORT = {
+    'REFRESH_INTERVAL': 60,
+    'ORDER_LAG': 60,
+}
+
+#Per-request query count and timings (see shop/metrics.py), samples kept per URL name
+SHOP_REQUEST_METRICS = {
+    'ENABLED': True,
+    'SERVER_TIMING': True,
+    'WINDOW': 500,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # One line per request; in development the Server-Timing header is enough
+        'shop.requests': {
+            'handlers': ['console'],
+            'level': os.environ.get('SHOP_REQUEST_LOG_LEVEL', 'WARNING' if DEBUG else 'INFO'),
+        },
+    },
+}
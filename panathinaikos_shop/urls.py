@@ -5,7 +5,7 @@ from django.contrib import admin
 from django.urls import path
 from django.conf import settings
 from django.conf.urls.static import static
-from shop import views
+from shop import api, views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -20,8 +20,16 @@ urlpatterns = [
     path('cart/', views.cart_view, name='cart'),
     path('cart/add/<int:product_id>/', views.add_to_cart, name='add_to_cart'),
     path('cart/remove/<int:item_id>/', views.remove_from_cart, name='remove_from_cart'),
+    path('cart/batch/', views.cart_batch, name='cart_batch'),
     path('checkout/', views.checkout, name='checkout'),
     path('rating/add/<int:product_id>/', views.add_rating, name='add_rating'),
+    path('api/products/', api.products, name='api_products'),
+    path('api/products/<slug:slug>/', api.product_detail, name='api_product_detail'),
+    path('api/categories/', api.categories, name='api_categories'),
+    path('api/facets/', api.facets, name='api_facets'),
+    path('staff/metrics/', views.staff_metrics, name='staff_metrics'),
+    path('staff/sales/', views.staff_sales, name='staff_sales'),
+    path('staff/orders.csv', views.staff_orders_export, name='staff_orders_export'),
 ]
 
 # Για να δουλεύουν οι εικόνες σε development mode
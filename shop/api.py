@@ -0,0 +1,136 @@
+"""
+Read-only JSON catalog API.
+
+Every endpoint answers conditional GETs: the ETag is derived from the
+newest updated_at and the size of the result set plus the querystring, so
+clients and CDNs revalidate with one aggregate query and get a 304 without
+the results being loaded or serialized.
+"""
+import hashlib
+
+from django.core.paginator import Paginator
+from django.db.models import Count, Max
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.views.decorators.http import condition, require_GET
+
+from .catalog import filter_products, search_products, supports_cursor
+from .facets import get_facets
+from .models import Category, Product
+from .pagination import CursorPaginator, InvalidCursor
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+
+def make_etag(*parts):
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def serialize_product(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'slug': product.slug,
+        'url': reverse('product_detail', args=[product.slug]),
+        'category': {
+            'id': product.category.id,
+            'name': product.category.name,
+            'slug': product.category.slug,
+        },
+        'description': product.description,
+        'price': str(product.price),
+        'stock': product.stock,
+        'size': product.size,
+        'type': product.type,
+        'season': product.season,
+        'color': product.color,
+        'image_url': product.image_url,
+        'avg_rating': round(product.average_rating(), 2),
+        'rating_count': product.rating_count,
+        'updated_at': product.updated_at.isoformat(),
+    }
+
+
+def get_page_size(params):
+    try:
+        return max(1, min(int(params.get('page_size', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE))
+    except ValueError:
+        return DEFAULT_PAGE_SIZE
+
+
+def products_etag(request):
+    products, _, _ = filter_products(request.GET)
+    state = products.order_by().aggregate(last=Max('updated_at'), count=Count('id'))
+    return make_etag(request.path, state['last'], state['count'], sorted(request.GET.lists()))
+
+
+def product_detail_etag(request, slug):
+    updated_at = Product.objects.filter(slug=slug, is_active=True).values_list('updated_at', flat=True).first()
+    return make_etag(request.path, updated_at) if updated_at else None
+
+
+def categories_etag(request):
+    return make_etag(request.path, list(Category.objects.values_list('id', 'name', 'slug', 'description', 'parent_id')))
+
+
+def facets_etag(request):
+    # Facets count the products matching the search, whatever the filters are
+    products, _ = search_products(request.GET)
+    state = products.order_by().aggregate(last=Max('updated_at'), count=Count('id'))
+    return make_etag(request.path, state['last'], state['count'], sorted(request.GET.lists()))
+
+
+@require_GET
+@condition(etag_func=products_etag)
+def products(request):
+    """Products matching the product_list filters"""
+    products, search_query, sort_by = filter_products(request.GET)
+    page_size = get_page_size(request.GET)
+
+    if supports_cursor(request.GET, search_query, sort_by):
+        try:
+            page = CursorPaginator(products, sort_by, page_size).get_page(request.GET.get('cursor'))
+        except InvalidCursor:
+            return JsonResponse({'error': 'Invalid cursor'}, status=400)
+        return JsonResponse({
+            'next': page.next_cursor,
+            'previous': page.previous_cursor,
+            'results': [serialize_product(product) for product in page],
+        })
+
+    paginator = Paginator(products, page_size)
+    page = paginator.get_page(request.GET.get('page'))
+    return JsonResponse({
+        'count': paginator.count,
+        'page': page.number,
+        'num_pages': paginator.num_pages,
+        'results': [serialize_product(product) for product in page],
+    })
+
+
+@require_GET
+@condition(etag_func=product_detail_etag)
+def product_detail(request, slug):
+    """Single product"""
+    product = get_object_or_404(Product.objects.catalog(), slug=slug)
+    return JsonResponse(serialize_product(product))
+
+
+@require_GET
+@condition(etag_func=categories_etag)
+def categories(request):
+    """All categories"""
+    return JsonResponse({'results': [
+        {'id': category.id, 'name': category.name, 'slug': category.slug,
+         'description': category.description, 'parent': category.parent_id}
+        for category in Category.objects.all()
+    ]})
+
+
+@require_GET
+@condition(etag_func=facets_etag)
+def facets(request):
+    """Product counts per filter option"""
+    return JsonResponse(get_facets(request.GET))
@@ -0,0 +1,105 @@
+"""
+Request benchmark of the hot endpoints, driven through the Django test client.
+
+Every scenario issues `iterations` requests (after `warmup` unmeasured ones)
+and reports latency and query count percentiles, measured with the same
+timer as RequestMetricsMiddleware (metrics.record()).
+
+    home            GET /
+    product_list    GET /products/ cycling through filter/sort/search mixes
+    product_detail  GET /product/<slug>/ of random products, logged in
+    cart            POST add_to_cart and cart_batch, logged in
+    checkout        POST /checkout/ of a one line cart, logged in
+"""
+import random
+
+from django.contrib.auth.models import User
+from django.test import Client
+from django.urls import reverse
+
+from .metrics import percentile, record
+from .models import Category, Product
+
+SCENARIOS = ['home', 'product_list', 'product_detail', 'cart', 'checkout']
+
+LISTING_QUERIES = [
+    '',
+    'sort_by=price_asc',
+    'category={category}',
+    'category={category}&min_price=20&max_price=60',
+    'size=M&type=MEN&sort_by=newest',
+    'season=RETRO&color=green',
+    'search=jersey',
+    'search=retro+scarf&sort_by=price_desc',
+    'page=20',
+]
+
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        'p50': round(percentile(values, 0.50), 2),
+        'p95': round(percentile(values, 0.95), 2),
+        'mean': round(sum(values) / len(values), 2),
+        'max': round(values[-1], 2),
+    }
+
+
+class Benchmark:
+    def __init__(self, iterations=50, warmup=5, seed=0):
+        self.iterations = iterations
+        self.warmup = warmup
+        self.random = random.Random(seed)
+        self.anonymous = Client()
+        self.client = Client()
+        self.client.force_login(User.objects.order_by('id').first())
+        self.product_ids = list(Product.objects.filter(is_active=True).values_list('id', flat=True))
+        self.category_ids = list(Category.objects.values_list('id', flat=True))
+
+    def random_product(self):
+        return Product.objects.only('id', 'slug').get(id=self.random.choice(self.product_ids))
+
+    def home(self):
+        return self.anonymous.get, reverse('home'), {}
+
+    def product_list(self):
+        query = self.random.choice(LISTING_QUERIES).format(category=self.random.choice(self.category_ids))
+        return self.anonymous.get, f"{reverse('product_list')}?{query}", {}
+
+    def product_detail(self):
+        return self.client.get, reverse('product_detail', args=[self.random_product().slug]), {}
+
+    def cart(self):
+        product_id = self.random.choice(self.product_ids)
+        if self.random.random() < 0.5:
+            return self.client.post, reverse('add_to_cart', args=[product_id]), {}
+        return self.client.post, reverse('cart_batch'), {
+            'data': {'operations': [{'op': 'add', 'product_id': product_id, 'quantity': 2}]},
+            'content_type': 'application/json',
+        }
+
+    def checkout(self):
+        # The cart line is set up outside the measured request
+        self.client.post(reverse('add_to_cart', args=[self.random.choice(self.product_ids)]))
+        return self.client.post, reverse('checkout'), {}
+
+    def run_scenario(self, name):
+        latencies, queries, statuses = [], [], {}
+        for i in range(self.warmup + self.iterations):
+            method, url, kwargs = getattr(self, name)()
+            with record() as timer:
+                response = method(url, **kwargs)
+            if i < self.warmup:
+                continue
+            latencies.append(timer.total * 1000)
+            queries.append(timer.queries)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        return {
+            'requests': self.iterations,
+            'latency_ms': summarize(latencies),
+            'queries': summarize(queries),
+            'status': statuses,
+        }
+
+    def run(self, scenarios=SCENARIOS):
+        return {name: self.run_scenario(name) for name in scenarios}
@@ -0,0 +1,205 @@
+"""
+Cart mutations applied as a batch.
+
+A batch is a list of operations:
+
+    {"op": "add",    "product_id": 3, "quantity": 2}
+    {"op": "set",    "item_id": 7,    "quantity": 1}   (0 removes the line)
+    {"op": "remove", "item_id": 7}
+
+The cart lines are loaded once, the operations are folded in memory and the
+result is written with at most one bulk_create, one bulk_update and one
+DELETE, inside a single transaction.
+
+Anonymous visitors get a SessionCart instead, stored as {product_id: quantity}
+in their session. The DB Cart row is only created on a user's first add, and
+the session cart is merged into it with a single bulk upsert on login.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+
+from .models import Cart, CartItem, Product
+
+SESSION_CART_KEY = 'cart'
+
+OPERATIONS = ('add', 'set', 'remove')
+MAX_OPERATIONS = 100
+
+
+class CartOperationError(ValueError):
+    pass
+
+
+def _quantity(operation, default):
+    try:
+        quantity = int(operation.get('quantity', default))
+    except (TypeError, ValueError):
+        raise CartOperationError('Invalid quantity')
+    if quantity < 0:
+        raise CartOperationError('Invalid quantity')
+    return quantity
+
+
+def fold_operations(operations, items):
+    """Final {product_id: quantity} after applying operations to the existing lines"""
+    if not isinstance(operations, list) or len(operations) > MAX_OPERATIONS:
+        raise CartOperationError('Invalid operations')
+
+    by_item_id = {item.id: item for item in items.values()}
+    quantities = {product_id: item.quantity for product_id, item in items.items()}
+
+    for operation in operations:
+        if not isinstance(operation, dict) or operation.get('op', 'add') not in OPERATIONS:
+            raise CartOperationError('Invalid operation')
+        kind = operation.get('op', 'add')
+
+        if 'item_id' in operation:
+            try:
+                item = by_item_id.get(int(operation['item_id']))
+            except (TypeError, ValueError):
+                item = None
+            if item is None:
+                raise CartOperationError('Cart item not found')
+            product_id = item.product_id
+        elif 'product_id' in operation:
+            try:
+                product_id = int(operation['product_id'])
+            except (TypeError, ValueError):
+                raise CartOperationError('Invalid product')
+        else:
+            raise CartOperationError('Operation needs an item_id or a product_id')
+
+        if kind == 'add':
+            quantities[product_id] = quantities.get(product_id, 0) + _quantity(operation, 1)
+        elif kind == 'set':
+            quantities[product_id] = _quantity(operation, 1)
+        else:
+            quantities[product_id] = 0
+
+    return quantities
+
+
+def apply_operations(cart, operations):
+    """Apply a batch to a DB cart, returns the cart lines afterwards"""
+    with transaction.atomic():
+        items = {item.product_id: item for item in CartItem.objects.select_for_update().filter(cart=cart)}
+        quantities = fold_operations(operations, items)
+
+        new_ids = [product_id for product_id, quantity in quantities.items()
+                   if quantity > 0 and product_id not in items]
+        if new_ids:
+            active = set(Product.objects.filter(id__in=new_ids, is_active=True).values_list('id', flat=True))
+            if len(active) != len(new_ids):
+                raise CartOperationError('Product not found')
+
+        created = CartItem.objects.bulk_create([
+            CartItem(cart=cart, product_id=product_id, quantity=quantities[product_id])
+            for product_id in new_ids
+        ])
+        changed, removed = [], []
+        for product_id, item in items.items():
+            if quantities[product_id] <= 0:
+                removed.append(item.id)
+            elif quantities[product_id] != item.quantity:
+                item.quantity = quantities[product_id]
+                changed.append(item)
+        if changed:
+            CartItem.objects.bulk_update(changed, ['quantity'])
+        if removed:
+            CartItem.objects.filter(id__in=removed).delete()
+
+    cart.invalidate_summary()
+    return [item for item in items.values() if item.id not in removed] + created
+
+
+def get_cart(user, create=False):
+    """The user's DB cart, only created when `create` is set"""
+    cart = Cart.objects.filter(user=user).order_by('id').first()
+    if cart is None and create:
+        cart = Cart.objects.create(user=user)
+    return cart
+
+
+class SessionItem:
+    """Cart line of a SessionCart, the product id doubles as the item id"""
+
+    def __init__(self, product_id, quantity, product=None):
+        self.id = self.product_id = product_id
+        self.quantity = quantity
+        self.product = product
+
+    def get_subtotal(self):
+        return self.product.price * self.quantity
+
+
+class SessionCart:
+    """Cart of an anonymous visitor, kept in the session"""
+
+    def __init__(self, session):
+        self.session = session
+
+    @property
+    def quantities(self):
+        return {int(product_id): quantity for product_id, quantity in self.session.get(SESSION_CART_KEY, {}).items()}
+
+    def save(self, quantities):
+        self.session[SESSION_CART_KEY] = {
+            str(product_id): quantity for product_id, quantity in quantities.items() if quantity > 0
+        }
+
+    def clear(self):
+        self.session.pop(SESSION_CART_KEY, None)
+
+    def count(self):
+        return sum(self.quantities.values())
+
+    def get_items(self):
+        """Lines with their products, in one query"""
+        quantities = self.quantities
+        products = Product.objects.filter(id__in=quantities, is_active=True).in_bulk()
+        return [SessionItem(product_id, quantity, products[product_id])
+                for product_id, quantity in quantities.items() if product_id in products]
+
+    def get_summary(self, items=None):
+        items = self.get_items() if items is None else items
+        return {
+            'count': sum(item.quantity for item in items),
+            'total': sum((item.get_subtotal() for item in items), Decimal('0.00')),
+        }
+
+    def apply_operations(self, operations):
+        quantities = self.quantities
+        items = {product_id: SessionItem(product_id, quantity) for product_id, quantity in quantities.items()}
+        quantities = fold_operations(operations, items)
+
+        new_ids = [product_id for product_id, quantity in quantities.items()
+                   if quantity > 0 and product_id not in items]
+        if new_ids and Product.objects.filter(id__in=new_ids, is_active=True).count() != len(new_ids):
+            raise CartOperationError('Product not found')
+        self.save(quantities)
+        return [SessionItem(product_id, quantity) for product_id, quantity in quantities.items() if quantity > 0]
+
+
+def merge_session_cart(request, user):
+    """Move the session cart of a visitor who just logged in to their DB cart"""
+    session_cart = SessionCart(request.session)
+    quantities = session_cart.quantities
+    if not quantities:
+        return None
+
+    with transaction.atomic():
+        cart = get_cart(user, create=True)
+        existing = dict(CartItem.objects.filter(cart=cart, product_id__in=quantities)
+                        .values_list('product_id', 'quantity'))
+        active = Product.objects.filter(id__in=quantities, is_active=True).values_list('id', flat=True)
+        CartItem.objects.bulk_create(
+            [CartItem(cart=cart, product_id=product_id, quantity=existing.get(product_id, 0) + quantities[product_id])
+             for product_id in active],
+            update_conflicts=True,
+            unique_fields=['cart', 'product'],
+            update_fields=['quantity'],
+        )
+    session_cart.clear()
+    cart.invalidate_summary()
+    return cart
@@ -0,0 +1,114 @@
+"""
+Catalog querystring parsing shared by product_list and the JSON API.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+from .models import Product
+from .pagination import CURSOR_ORDERINGS
+from .search import get_search_backend
+
+SORTINGS = {
+    'price_asc': ['price'],
+    'price_desc': ['-price'],
+    'name_asc': ['name'],
+    'name_desc': ['-name'],
+    'newest': ['-created_at'],
+}
+
+
+def get_param(params, name):
+    return params.get(name, '').strip()
+
+
+def _number(value, cast):
+    """value cast to a number, None if it isn't a (finite) one"""
+    try:
+        number = cast(value)
+    except (ValueError, ArithmeticError, ValidationError):
+        return None
+    if isinstance(number, Decimal) and not number.is_finite():
+        return None
+    return number
+
+
+def filter_conditions(params):
+    """One Q per filter dimension present in the querystring"""
+    conditions = {}
+
+    category_id = _number(get_param(params, 'category'), int)
+    if category_id is not None:
+        conditions['category'] = Q(category_id=category_id)
+
+    price = Q()
+    min_price = _number(get_param(params, 'min_price'), Decimal)
+    if min_price is not None:
+        price &= Q(price__gte=min_price)
+    max_price = _number(get_param(params, 'max_price'), Decimal)
+    if max_price is not None:
+        price &= Q(price__lte=max_price)
+    if price:
+        conditions['price'] = price
+
+    for field in ('size', 'type', 'season'):
+        value = get_param(params, field)
+        if value:
+            conditions[field] = Q(**{field: value})
+
+    color = get_param(params, 'color')
+    if color:
+        conditions['color'] = Q(color__icontains=color)
+
+    return conditions
+
+
+def combine(conditions, exclude=()):
+    """AND of the conditions, skipping the dimensions in `exclude`"""
+    combined = Q()
+    for dimension, condition in conditions.items():
+        if dimension not in exclude:
+            combined &= condition
+    return combined
+
+
+def apply_filters(products, params, exclude=()):
+    """Filter products by the querystring, skipping the dimensions in `exclude`"""
+    return products.filter(combine(filter_conditions(params), exclude))
+
+
+def sort_products(products, sort_by, search_query=''):
+    if sort_by in SORTINGS:
+        return products.order_by(*SORTINGS[sort_by])
+    if search_query:
+        return products.order_by('-search_rank', '-created_at')
+    return products.order_by('-created_at')
+
+
+def search_products(params, queryset=None):
+    """Catalog products narrowed by the search box, if any"""
+    products = Product.objects.catalog() if queryset is None else queryset
+    search_query = get_param(params, 'search')
+    if search_query:
+        products = get_search_backend().search(products, search_query)
+    return products, search_query
+
+
+def filter_products(params):
+    """
+    Products for a catalog querystring (search, filters and sort_by),
+    returns (products, search_query, sort_by)
+    """
+    products, search_query = search_products(params)
+    products = apply_filters(products, params)
+    sort_by = get_param(params, 'sort_by')
+    return sort_products(products, sort_by, search_query), search_query, sort_by
+
+
+def supports_cursor(params, search_query, sort_by):
+    """Keyset pagination is opt-in and can't follow relevance ordering"""
+    pagination = params.get('pagination', settings.SHOP_CATALOG_PAGINATION)
+    return (pagination == 'cursor' and sort_by in CURSOR_ORDERINGS
+            and not (search_query and not sort_by))
@@ -0,0 +1,212 @@
+"""
+Streaming catalog import/export (CSV or JSON lines).
+
+Rows are read and written one chunk at a time, so the size of the file
+doesn't matter. An import chunk costs a handful of queries whatever its
+size: which slugs already exist, one bulk upsert on slug
+(bulk_create(update_conflicts=True)), and reading back the ids for the
+search index. Categories are resolved from a slug map loaded once.
+
+Rows without a slug are keyed on slugify(name), like Product.save(), so
+re-importing the same feed updates the products it created. A slugless row
+whose name slugifies to nothing (e.g. a Greek-only name) or to a slug
+already used in the file is rejected rather than numbered by its position,
+which would update a different product when the feed is reordered.
+Supplied slugs must already be valid slugs, they end up in the <slug:slug>
+URLs.
+"""
+import csv
+import io
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils.text import slugify
+
+from .fragments import bump_catalog_version
+from .models import Category, Product
+from .search import get_search_backend
+from .synthetic import batched
+
+FIELDS = ['slug', 'name', 'category', 'description', 'price', 'stock', 'size', 'type', 'season',
+          'brand', 'color', 'image_url', 'is_active']
+# Columns written by an upsert, created_at/views/ratings stay as they are
+UPDATE_FIELDS = ['name', 'category', 'description', 'price', 'stock', 'size', 'type', 'season',
+                 'brand', 'color', 'image_url', 'is_active', 'updated_at']
+
+CHOICES = {
+    'size': dict(Product.SIZE_CHOICES),
+    'type': dict(Product.TYPE_CHOICES),
+    'season': dict(Product.SEASON_CHOICES),
+}
+TRUE = {'1', 'true', 'yes', 'y', 't'}
+FALSE = {'0', 'false', 'no', 'n', 'f', ''}
+
+
+class RowError(ValueError):
+    pass
+
+
+def guess_format(path):
+    return 'jsonl' if path.endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def read_rows(stream, format='csv'):
+    """Dicts of a CSV (with a header) or JSON lines text stream"""
+    if format == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield {'__error__': 'Invalid JSON'}
+
+
+def export_rows(queryset=None, chunk_size=2000):
+    """Catalog rows, the products read chunk_size at a time"""
+    queryset = Product.objects.all() if queryset is None else queryset
+    columns = [('category__slug' if field == 'category' else field) for field in FIELDS]
+    for values in queryset.order_by('id').values_list(*columns).iterator(chunk_size=chunk_size):
+        row = dict(zip(FIELDS, values))
+        row['price'] = str(row['price'])
+        yield row
+
+
+def write_rows(rows, stream, format='csv'):
+    """Write rows to a text stream, returns how many"""
+    count = 0
+    if format == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=FIELDS)
+        writer.writeheader()
+        for count, row in enumerate(rows, 1):
+            writer.writerow(row)
+    else:
+        for count, row in enumerate(rows, 1):
+            stream.write(json.dumps(row, ensure_ascii=False) + '\n')
+    return count
+
+
+def open_text(path, mode):
+    return io.open(path, mode, encoding='utf-8', newline='' if path.endswith('.csv') else None)
+
+
+class CatalogImporter:
+    def __init__(self, batch_size=2000, dry_run=False, create_categories=False):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.create_categories = create_categories
+        self.categories = dict(Category.objects.values_list('slug', 'id'))
+        # Slugs used by the rows of this file so far
+        self.file_slugs = set()
+        self.stats = {'rows': 0, 'created': 0, 'updated': 0, 'skipped': 0}
+        self.errors = []
+
+    def slug(self, row, name):
+        slug = str(row.get('slug') or '').strip()
+        if slug:
+            if slugify(slug) != slug:
+                raise RowError(f'invalid slug {slug!r}')
+        else:
+            slug = slugify(name)
+            if not slug:
+                raise RowError(f'no slug can be made from {name!r}, add a slug column')
+        if slug in self.file_slugs:
+            raise RowError(f'slug {slug!r} already used in this file')
+        self.file_slugs.add(slug)
+        return slug
+
+    def category_id(self, value):
+        value = (value or '').strip()
+        if not value:
+            raise RowError('category is required')
+        slug = slugify(value) or value
+        if slug not in self.categories:
+            if not self.create_categories:
+                raise RowError(f'unknown category {value!r}')
+            category = Category.objects.create(name=value, slug=slug)
+            self.categories[slug] = category.id
+        return self.categories[slug]
+
+    def clean(self, row):
+        """Product for a row, raises RowError"""
+        if '__error__' in row:
+            raise RowError(row['__error__'])
+        name = str(row.get('name') or '').strip()
+        if not name:
+            raise RowError('name is required')
+        try:
+            price = Decimal(str(row.get('price', '')).strip())
+            stock = int(row.get('stock') or 0)
+        except (InvalidOperation, TypeError, ValueError):
+            raise RowError('invalid price or stock')
+        if price < 0 or stock < 0:
+            raise RowError('price and stock must not be negative')
+
+        values = {}
+        for field, choices in CHOICES.items():
+            value = str(row.get(field) or '').strip() or Product._meta.get_field(field).default
+            if value not in choices:
+                raise RowError(f'invalid {field} {value!r}')
+            values[field] = value
+
+        is_active = str(row.get('is_active', '1')).strip().lower()
+        if is_active not in TRUE | FALSE:
+            raise RowError(f'invalid is_active {is_active!r}')
+
+        category_id = self.category_id(row.get('category'))
+        return Product(
+            slug=self.slug(row, name),
+            name=name,
+            category_id=category_id,
+            description=str(row.get('description') or ''),
+            price=price,
+            stock=stock,
+            brand=str(row.get('brand') or '').strip() or Product._meta.get_field('brand').default,
+            color=str(row.get('color') or '').strip() or Product._meta.get_field('color').default,
+            image_url=str(row.get('image_url') or '').strip() or None,
+            is_active=is_active in TRUE,
+            **values,
+        )
+
+    def import_chunk(self, rows, first_line):
+        products = {}
+        for line, row in enumerate(rows, first_line):
+            self.stats['rows'] += 1
+            try:
+                product = self.clean(row)
+            except RowError as e:
+                self.stats['skipped'] += 1
+                self.errors.append((line, str(e)))
+                continue
+            # The last row of a slug wins, one upsert can't touch a row twice
+            products[product.slug] = product
+        if not products:
+            return
+
+        existing = set(Product.objects.filter(slug__in=list(products)).values_list('slug', flat=True))
+        self.stats['updated'] += len(existing)
+        self.stats['created'] += len(products) - len(existing)
+
+        Product.objects.bulk_create(
+            list(products.values()),
+            update_conflicts=True,
+            unique_fields=['slug'],
+            update_fields=UPDATE_FIELDS,
+        )
+        get_search_backend().index_many(
+            Product.objects.filter(slug__in=list(products)).only('id', 'name', 'color', 'description')
+        )
+
+    def run(self, rows):
+        """Import an iterable of row dicts, returns the stats"""
+        with transaction.atomic():
+            # Rows are numbered from 1, not counting the CSV header
+            for index, chunk in enumerate(batched(rows, self.batch_size)):
+                self.import_chunk(chunk, index * self.batch_size + 1)
+            if self.dry_run:
+                transaction.set_rollback(True)
+        if not self.dry_run:
+            bump_catalog_version()
+        return self.stats
@@ -0,0 +1,20 @@
+"""
+Template context shared by every page.
+
+The navbar cart badge is read from the session, which the session middleware
+loads anyway, so rendering it costs no queries. Anonymous visitors' carts live
+in the session too (see carts.SessionCart). The cart views keep the
+stored count in sync through set_cart_count().
+"""
+CART_COUNT_SESSION_KEY = 'cart_count'
+
+
+def set_cart_count(request, count):
+    if request.session.get(CART_COUNT_SESSION_KEY) != count:
+        request.session[CART_COUNT_SESSION_KEY] = count
+
+
+def cart(request):
+    """Number of items in the cart for the navbar badge"""
+    return {'cart_count': request.session.get(CART_COUNT_SESSION_KEY, 0)}
+
@@ -0,0 +1,216 @@
+"""
+Write-behind buffers for the product_detail request path.
+
+Page views and view history events are collected in process memory and
+written back in batches once a buffer holds its THRESHOLD events or
+INTERVAL seconds have passed:
+
+* view_counter  -> one `UPDATE ... SET views = views + CASE ...` statement
+* view_history  -> one bulk upsert of (user, product, viewed_at) rows
+
+Both are flushed at interpreter shutdown and can be flushed by hand with
+flush_all() (tests, management commands). Only those explicit flushes raise
+when the write fails; the automatic ones on the request path log the error
+and keep the batch for the next try, a locked database never fails a page.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import IntegrityError
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    """Thread safe in-memory buffer with threshold/interval based flushing"""
+
+    setting_name = None
+    defaults = {
+        'THRESHOLD': 100,
+        'INTERVAL': 30,
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = self.empty()
+        self._last_flush = time.monotonic()
+
+    def empty(self):
+        raise NotImplementedError
+
+    def write(self, pending):
+        """Persist a batch, returns the number of rows written"""
+        raise NotImplementedError
+
+    def size(self, pending):
+        return len(pending)
+
+    def merge(self, pending):
+        """Put back a batch that failed to write"""
+        self._pending.update(pending)
+
+    def get_config(self):
+        return {**self.defaults, **getattr(settings, self.setting_name, {})}
+
+    def __len__(self):
+        return self.size(self._pending)
+
+    def is_due(self):
+        config = self.get_config()
+        if not self._pending:
+            return False
+        return (len(self) >= config['THRESHOLD'] or
+                time.monotonic() - self._last_flush >= config['INTERVAL'])
+
+    def flush_if_due(self):
+        if self.is_due():
+            self.flush(raise_errors=False)
+
+    def clear(self):
+        with self._lock:
+            self._pending = self.empty()
+
+    def flush(self, raise_errors=True):
+        with self._lock:
+            pending, self._pending = self._pending, self.empty()
+            self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+
+        try:
+            return self.write(pending)
+        except Exception:
+            # Keep the batch so the next flush retries it
+            with self._lock:
+                self.merge(pending)
+            logger.exception('Could not flush %s (%d events)', self.__class__.__name__, self.size(pending))
+            if raise_errors:
+                raise
+            return 0
+
+
+class ViewCounterBuffer(WriteBehindBuffer):
+    """Aggregates Product.views increments per product"""
+
+    setting_name = 'SHOP_VIEW_COUNTER'
+
+    def empty(self):
+        return Counter()
+
+    def size(self, pending):
+        return sum(pending.values())
+
+    def pending(self, product_id):
+        return self._pending.get(product_id, 0)
+
+    def add(self, product_id, count=1):
+        with self._lock:
+            self._pending[product_id] += count
+        self.flush_if_due()
+
+    def write(self, pending):
+        from .models import Product
+
+        return Product.objects.filter(id__in=pending).update(views=F('views') + Case(
+            *[When(id=product_id, then=Value(count)) for product_id, count in pending.items()],
+            default=Value(0),
+        ))
+
+
+class ViewHistoryBuffer(WriteBehindBuffer):
+    """Latest view time per (user, product), upserted into ViewHistory"""
+
+    setting_name = 'SHOP_VIEW_HISTORY'
+    defaults = {
+        'THRESHOLD': 200,
+        'INTERVAL': 30,
+        'RETENTION_DAYS': 90,
+    }
+
+    def empty(self):
+        return {}
+
+    def add(self, user_id, product_id, viewed_at=None):
+        key = (user_id, product_id)
+        viewed_at = viewed_at or timezone.now()
+        with self._lock:
+            if key not in self._pending or self._pending[key] < viewed_at:
+                self._pending[key] = viewed_at
+        self.flush_if_due()
+
+    def merge(self, pending):
+        for key, viewed_at in pending.items():
+            if key not in self._pending or self._pending[key] < viewed_at:
+                self._pending[key] = viewed_at
+
+    def upsert(self, rows):
+        from .models import ViewHistory
+
+        ViewHistory.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['user', 'product'],
+            update_fields=['viewed_at'],
+        )
+
+    def write(self, pending):
+        from django.contrib.auth import get_user_model
+
+        from .models import Product, ViewHistory
+
+        # Users and products deleted since their views were queued would fail
+        # the whole upsert, and the batch would be put back forever
+        user_ids = set(get_user_model().objects.filter(id__in={user_id for user_id, _ in pending})
+                       .values_list('id', flat=True))
+        product_ids = set(Product.objects.filter(id__in={product_id for _, product_id in pending})
+                          .values_list('id', flat=True))
+        rows = [
+            ViewHistory(user_id=user_id, product_id=product_id, viewed_at=viewed_at)
+            for (user_id, product_id), viewed_at in pending.items()
+            if user_id in user_ids and product_id in product_ids
+        ]
+        if not rows:
+            return 0
+        try:
+            self.upsert(rows)
+        except IntegrityError:
+            # Deleted in the meantime, write row by row and drop the rows that still fail
+            written = 0
+            for row in rows:
+                try:
+                    self.upsert([row])
+                    written += 1
+                except IntegrityError:
+                    logger.warning('Dropped the view of product %s by user %s', row.product_id, row.user_id)
+            return written
+        return len(rows)
+
+
+view_counter = ViewCounterBuffer()
+view_history = ViewHistoryBuffer()
+BUFFERS = [view_counter, view_history]
+
+
+def flush_all():
+    return sum(buffer.flush() for buffer in BUFFERS)
+
+
+def flush_if_due(**kwargs):
+    for buffer in BUFFERS:
+        buffer.flush_if_due()
+
+
+def flush_at_exit():
+    for buffer in BUFFERS:
+        buffer.flush(raise_errors=False)
+
+
+request_finished.connect(flush_if_due, dispatch_uid='shop.counters.flush_if_due')
+atexit.register(flush_at_exit)
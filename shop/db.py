@@ -0,0 +1,32 @@
+"""
+SQLite tuning applied to every new connection (see signals.tune_sqlite).
+
+    journal_mode=WAL      readers don't block the writer and vice versa
+    synchronous=NORMAL    fsync on checkpoints only, safe with WAL
+    busy_timeout          wait for the write lock instead of failing with
+                          "database is locked"
+    cache_size/mmap_size  page cache per connection / memory mapped reads
+
+The pragmas come from settings.SHOP_SQLITE_PRAGMAS, in order. busy_timeout
+goes first so switching the journal mode waits for other connections too.
+"""
+from django.conf import settings
+
+DEFAULT_PRAGMAS = {
+    'busy_timeout': 5000,
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'cache_size': -20000,
+    'mmap_size': 128 * 1024 * 1024,
+    'temp_store': 'memory',
+}
+
+
+def get_pragmas():
+    return getattr(settings, 'SHOP_SQLITE_PRAGMAS', DEFAULT_PRAGMAS)
+
+
+def apply_pragmas(cursor, pragmas=None):
+    """Run the PRAGMA statements on a DB-API cursor"""
+    for name, value in (get_pragmas() if pragmas is None else pragmas).items():
+        cursor.execute(f'PRAGMA {name} = {value}')
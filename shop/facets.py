@@ -0,0 +1,93 @@
+"""
+Facet counts for the catalog filter bar.
+
+All options of every dimension are counted in a single aggregate query:
+
+    SELECT COUNT(id) FILTER (WHERE <other filters> AND size = 'M') AS size__M, ...
+
+Each dimension is counted against the current filters minus its own, so an
+option shows how many products selecting it would give. Results are cached
+per filter signature and catalog version.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .catalog import combine, filter_conditions, search_products
+from .fragments import catalog_version
+from .models import Category, Product
+from .pagination import filter_signature
+
+# (min, max) in euros, max is exclusive, None means open ended
+PRICE_BUCKETS = [
+    (0, 25),
+    (25, 50),
+    (50, 75),
+    (75, None),
+]
+
+
+def price_bucket_label(low, high):
+    return f'€{low}+' if high is None else f'€{low} - €{high}'
+
+
+def facet_options(categories):
+    """(dimension, value, label, condition) of every countable option"""
+    options = [('category', str(category.id), category.name, Q(category_id=category.id))
+               for category in categories]
+    for dimension, choices in (('size', Product.SIZE_CHOICES),
+                               ('type', Product.TYPE_CHOICES),
+                               ('season', Product.SEASON_CHOICES)):
+        options += [(dimension, value, label, Q(**{dimension: value})) for value, label in choices]
+    for low, high in PRICE_BUCKETS:
+        condition = Q(price__gte=low) if high is None else Q(price__gte=low, price__lt=high)
+        options.append(('price', f'{low}-{high or ""}', price_bucket_label(low, high), condition))
+    return options
+
+
+def price_querystring(params, option):
+    """Catalog querystring with only the price filter replaced by a bucket"""
+    query = params.copy()
+    # A page number or cursor belongs to the old results
+    for name in ('page', 'cursor', 'min_price', 'max_price'):
+        query.pop(name, None)
+    query['min_price'] = option['min']
+    if option['max']:
+        query['max_price'] = option['max']
+    return query.urlencode()
+
+
+def compute_facets(params, categories=None):
+    """{dimension: [{'value', 'label', 'count'}, ...]} for the catalog querystring"""
+    if categories is None:
+        categories = Category.objects.all()
+    options = facet_options(categories)
+    conditions = filter_conditions(params)
+    products, _ = search_products(params, Product.objects.filter(is_active=True))
+
+    aggregates = {
+        f'facet_{index}': Count('id', filter=combine(conditions, exclude=[dimension]) & condition)
+        for index, (dimension, value, label, condition) in enumerate(options)
+    }
+    counts = products.order_by().aggregate(**aggregates) if aggregates else {}
+
+    facets = {'category': [], 'size': [], 'type': [], 'season': [], 'price': []}
+    for index, (dimension, value, label, condition) in enumerate(options):
+        facets[dimension].append({'value': value, 'label': label, 'count': counts[f'facet_{index}']})
+    # Price buckets link to the min_price/max_price filters (max_price is inclusive)
+    for option, (low, high) in zip(facets['price'], PRICE_BUCKETS):
+        option['min'] = low
+        option['max'] = '' if high is None else f'{high - 0.01:.2f}'
+    return facets
+
+
+def get_facets(params, categories=None):
+    """compute_facets() cached per filter signature, price buckets with their link"""
+    key = f'shop:facets:{catalog_version()}:{filter_signature(params)}'
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(params, categories)
+        cache.set(key, facets, getattr(settings, 'SHOP_FACET_CACHE_TIMEOUT', 300))
+    # The links keep the sort order and pagination mode, which the cache key ignores
+    return {**facets, 'price': [{**option, 'query': price_querystring(params, option)}
+                                for option in facets['price']]}
@@ -0,0 +1,94 @@
+"""
+Fragment cache for rendered product cards.
+
+A card is cached under its product id, updated_at and a per-product version
+number. The version lives in the cache and is bumped from the Product/Rating
+signals (see signals.py), which invalidates every cached card of the product
+without having to know the old keys. Pages prime their cards first
+({% primecards %}), so a page costs two cache round trips instead of two
+per card.
+
+The catalog version works the same way for data derived from the whole
+catalog (result counts, facets) and changes on every product save/delete.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+def get_cache():
+    return caches[getattr(settings, 'SHOP_FRAGMENT_CACHE', 'default')]
+
+
+def get_timeout():
+    return getattr(settings, 'SHOP_FRAGMENT_CACHE_TIMEOUT', 3600)
+
+
+def version_key(product_id):
+    return f'shop:card-version:{product_id}'
+
+
+def get_version(product_id):
+    """Current card version of a product, initialized on first use"""
+    cache = get_cache()
+    key = version_key(product_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(product_id):
+    """Invalidate all cached cards of a product"""
+    bump_versions([product_id])
+
+
+def bump_versions(product_ids):
+    version = time.time_ns()
+    get_cache().set_many({version_key(product_id): version for product_id in product_ids}, None)
+
+
+def card_key(name, product):
+    updated_at = product.updated_at.timestamp() if product.updated_at else ''
+    version = getattr(product, '_card_version', None)
+    if version is None:
+        version = get_version(product.pk)
+    return f'shop:card:{name}:{product.pk}:{updated_at}:{version}'
+
+
+def prime_cards(name, products):
+    """
+    Fetch the versions, then the cached HTML, of many cards with one get_many
+    each and keep them on the instances for card_key() and {% cardcache %}
+    """
+    cache = get_cache()
+    versions = cache.get_many({version_key(product.pk) for product in products})
+    for product in products:
+        key = version_key(product.pk)
+        if key not in versions:
+            versions[key] = get_version(product.pk)
+        product._card_version = versions[key]
+
+    keys = {card_key(name, product) for product in products}
+    cards = cache.get_many(keys)
+    for product in products:
+        key = card_key(name, product)
+        product._primed_cards = {**getattr(product, '_primed_cards', {}), key: cards.get(key)}
+
+
+CATALOG_VERSION_KEY = 'shop:catalog-version'
+
+
+def catalog_version():
+    cache = get_cache()
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    get_cache().set(CATALOG_VERSION_KEY, time.time_ns(), None)
@@ -0,0 +1,87 @@
+import json
+import platform
+import time
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+from shop.benchmark import SCENARIOS, Benchmark
+from shop.counters import view_counter, view_history
+from shop.synthetic import SyntheticData
+
+
+class Command(BaseCommand):
+    help = ('Seed a synthetic catalog in a throwaway test database and benchmark the hot endpoints '
+            '(p50/p95 latency and query counts). Use the default locmem cache.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000)
+        parser.add_argument('--ratings', type=int, default=1000000)
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--iterations', type=int, default=50, help='Measured requests per scenario')
+        parser.add_argument('--warmup', type=int, default=5, help='Unmeasured requests per scenario')
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS, dest='scenarios',
+                            help='Run only this scenario (repeatable)')
+        parser.add_argument('--json', help='Write the results to this file')
+        parser.add_argument('--compare', help='Results file of a previous run to compare with')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as f:
+                    baseline = json.load(f)['results']
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError(f"Can't read {options['compare']}: {e}")
+
+        # Never touch the configured database, seed a test database like the test runner does
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            start = time.perf_counter()
+            SyntheticData(options['seed'], stdout=self.stdout).catalog(
+                options['products'], options['ratings'], options['users'], options['categories'])
+            self.stdout.write(f'Seeded in {time.perf_counter() - start:.1f}s')
+
+            with override_settings(DEBUG=False, SHOP_REPLICA_DATABASE=None):
+                results = Benchmark(options['iterations'], options['warmup'], options['seed']).run(
+                    options['scenarios'] or SCENARIOS)
+        finally:
+            # Buffered views refer to the test database
+            view_counter.clear()
+            view_history.clear()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.report(results, baseline)
+        if options['json']:
+            with open(options['json'], 'w') as f:
+                json.dump({
+                    'meta': {
+                        'date': timezone.now().isoformat(),
+                        'django': django.get_version(),
+                        'python': platform.python_version(),
+                        'database': connection.vendor,
+                        **{name: options[name] for name in
+                           ('products', 'ratings', 'users', 'categories', 'seed', 'iterations', 'warmup')},
+                    },
+                    'results': results,
+                }, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"✅ Results written to {options['json']}"))
+
+    def report(self, results, baseline=None):
+        self.stdout.write(f"{'scenario':<16}{'p50 ms':>10}{'p95 ms':>10}{'queries p50':>13}{'queries max':>13}")
+        for name, result in results.items():
+            latency, queries = result['latency_ms'], result['queries']
+            line = (f"{name:<16}{latency['p50']:>10.1f}{latency['p95']:>10.1f}"
+                    f"{queries['p50']:>13g}{queries['max']:>13g}")
+            if baseline and name in baseline:
+                before = baseline[name]['latency_ms']
+                line += '   p50 {:+.0%} p95 {:+.0%}'.format(
+                    latency['p50'] / before['p50'] - 1 if before['p50'] else 0,
+                    latency['p95'] / before['p95'] - 1 if before['p95'] else 0,
+                )
+            self.stdout.write(line)
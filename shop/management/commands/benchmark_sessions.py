@@ -0,0 +1,52 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from shop.counters import flush_all, view_counter, view_history
+from shop.models import Product
+
+ENGINES = ['db', 'cached_db', 'cache', 'signed_cookies']
+
+
+class Command(BaseCommand):
+    help = 'Compare per-request DB queries of the session engines on the logged-in pages'
+
+    def handle(self, *args, **options):
+        product = Product.objects.filter(is_active=True).first()
+        if product is None:
+            raise CommandError('No active products, run populate_db first')
+        # Pending buffered writes belong to real traffic, not to the benchmark
+        flush_all()
+        urls = {
+            'dashboard': reverse('dashboard'),
+            'cart_view': reverse('cart'),
+            'product_detail': reverse('product_detail', args=[product.slug]),
+        }
+
+        self.stdout.write(f"{'engine':<16}" + ''.join(f'{name:>22}' for name in urls))
+        with transaction.atomic():
+            user = User.objects.create_user('session-benchmark')
+            for engine in ENGINES:
+                counts = self.measure(engine, user, urls)
+                self.stdout.write(f'{engine:<16}' + ''.join(
+                    f"{f'{total} ({session} session)':>22}" for total, session in counts))
+            # The benchmark user and its sessions are never committed
+            view_counter.clear()
+            view_history.clear()
+            transaction.set_rollback(True)
+
+    def measure(self, engine, user, urls):
+        """(queries, django_session queries) of a warm request to each url"""
+        with override_settings(SESSION_ENGINE=f'django.contrib.sessions.backends.{engine}'):
+            client = Client()
+            client.force_login(user)
+            counts = []
+            for url in urls.values():
+                client.get(url)
+                with CaptureQueriesContext(connection) as ctx:
+                    client.get(url)
+                session = sum('django_session' in query['sql'] for query in ctx.captured_queries)
+                counts.append((len(ctx.captured_queries), session))
+        return counts
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+from shop.recommendations import build_neighbors, get_config
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the similar products table (run nightly, e.g. from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=None, help="Neighbors per product (default: TOP_K)")
+
+    def handle(self, *args, **options):
+        config = get_config()
+        if options['top_k']:
+            config['TOP_K'] = options['top_k']
+
+        self.stdout.write(f"Computing the top {config['TOP_K']} similar products...")
+        start = time.perf_counter()
+        rows = build_neighbors(config)
+        self.stdout.write(self.style.SUCCESS(f'✅ Stored {rows} neighbors in {time.perf_counter() - start:.1f}s!'))
@@ -0,0 +1,32 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+from shop.catalog_sync import export_rows, guess_format, open_text, write_rows
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Stream the catalog to a CSV or JSON lines file (import_catalog format)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='-', help="File to write, '-' for stdout")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Default: from the file extension')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--active-only', action='store_true')
+
+    def handle(self, *args, **options):
+        path = options['output']
+        format = options['format'] or ('csv' if path == '-' else guess_format(path))
+        products = Product.objects.filter(is_active=True) if options['active_only'] else Product.objects.all()
+
+        start = time.perf_counter()
+        stream = sys.stdout if path == '-' else open_text(path, 'w')
+        try:
+            count = write_rows(export_rows(products, options['batch_size']), stream, format)
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+        elapsed = time.perf_counter() - start
+        # stdout may be the export itself
+        self.stderr.write(f'✅ Exported {count} products in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.0f} rows/s)')
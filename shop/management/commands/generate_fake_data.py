@@ -0,0 +1,58 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from shop.models import (Cart, CartItem, Category, Order, OrderItem, Product, Rating, UserProfile, ViewHistory,
+                         Wishlist)
+from shop.synthetic import BATCH_SIZE, SyntheticData
+
+MODELS = [Category, Product, User, UserProfile, Cart, CartItem, Rating, Wishlist, ViewHistory, Order, OrderItem]
+
+
+class Command(BaseCommand):
+    help = ('Fill the database with a deterministic fake shop (nested categories, products, users with '
+            'profiles and carts, ratings, wishlists, view history, orders) using bulk inserts. '
+            'The defaults make about 1.3M rows, run it on an empty database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--categories', type=int, default=30)
+        parser.add_argument('--category-depth', type=int, default=2, help='Levels of subcategories')
+        parser.add_argument('--products', type=int, default=100000)
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--ratings', type=int, default=400000)
+        parser.add_argument('--wishlists', type=int, default=100000)
+        parser.add_argument('--views', type=int, default=300000, help='View history rows')
+        parser.add_argument('--orders', type=int, default=100000, help='Orders, with 1-4 items each')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options['categories'] < 1 or options['products'] < 1 or options['users'] < 1:
+            raise CommandError('Need at least one category, product and user')
+
+        before = {model: model.objects.count() for model in MODELS}
+        start = time.perf_counter()
+        try:
+            with transaction.atomic():
+                SyntheticData(options['seed'], options['batch_size'], stdout=self.stdout).everything(
+                    categories=options['categories'],
+                    depth=options['category_depth'],
+                    products=options['products'],
+                    users=options['users'],
+                    ratings=options['ratings'],
+                    wishlists=options['wishlists'],
+                    views=options['views'],
+                    orders=options['orders'],
+                )
+        except IntegrityError as e:
+            raise CommandError(f'{e}. The generated names collide with existing rows, '
+                               f'run it on a fresh database (or flush it first).')
+        elapsed = time.perf_counter() - start
+
+        rows = sum(model.objects.count() - count for model, count in before.items())
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {rows} rows in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):.0f} rows/s)'
+        ))
+        self.stdout.write('Run update_rankings --force and build_recommendations to precompute the home page '
+                          'and similar products.')
@@ -0,0 +1,42 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from shop.catalog_sync import CatalogImporter, guess_format, open_text, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Upsert products (by slug) from a CSV or JSON lines file, streamed in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV/JSONL file, '-' for stdin")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Default: from the file extension')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--dry-run', action='store_true', help='Validate and count, write nothing')
+        parser.add_argument('--create-categories', action='store_true',
+                            help='Create unknown categories instead of skipping their rows')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or ('csv' if path == '-' else guess_format(path))
+        importer = CatalogImporter(options['batch_size'], options['dry_run'], options['create_categories'])
+
+        start = time.perf_counter()
+        try:
+            stream = sys.stdin if path == '-' else open_text(path, 'r')
+        except OSError as e:
+            raise CommandError(f"Can't read {path}: {e}")
+        with stream:
+            stats = importer.run(read_rows(stream, format))
+        elapsed = time.perf_counter() - start
+
+        for line, error in importer.errors[:20]:
+            self.stderr.write(f'row {line}: {error}')
+        if len(importer.errors) > 20:
+            self.stderr.write(f'... and {len(importer.errors) - 20} more')
+
+        prefix = '[dry run] ' if options['dry_run'] else '✅ '
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}{stats['rows']} rows: {stats['created']} created, {stats['updated']} updated, "
+            f"{stats['skipped']} skipped in {elapsed:.1f}s ({stats['rows'] / max(elapsed, 1e-9):.0f} rows/s)"
+        ))
@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from shop.counters import view_history
+from shop.models import ViewHistory
+
+
+class Command(BaseCommand):
+    help = 'Delete view history older than the retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help="Retention in days (default: SHOP_VIEW_HISTORY['RETENTION_DAYS'])")
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Rows deleted per statement, keeps write locks short')
+
+    def handle(self, *args, **options):
+        days = options['days']
+        if days is None:
+            days = view_history.get_config()['RETENTION_DAYS']
+        cutoff = timezone.now() - timedelta(days=days)
+        expired = ViewHistory.objects.filter(viewed_at__lt=cutoff).order_by()
+
+        self.stdout.write(f'Deleting view history older than {days} days...')
+        deleted = 0
+        while True:
+            batch = list(expired.values_list('id', flat=True)[:options['batch_size']])
+            if not batch:
+                break
+            deleted += ViewHistory.objects.filter(id__in=batch).delete()[0]
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Deleted {deleted} view history rows!'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized rating_count/rating_sum columns of the products'
+
+    def handle(self, *args, **kwargs):
+        self.stdout.write('Rebuilding rating aggregates...')
+        updated = Product.objects.all().rebuild_rating_aggregates()
+        self.stdout.write(self.style.SUCCESS(f'✅ Updated {updated} products!'))
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Periodic cleanup, meant to run from cron (e.g. hourly: manage.py run_maintenance)'
+
+    def handle(self, *args, **options):
+        # Cookie sessions expire client side, there is nothing to delete
+        if not settings.SESSION_ENGINE.endswith('signed_cookies'):
+            self.stdout.write('Clearing expired sessions...')
+            call_command('clearsessions', stdout=self.stdout, stderr=self.stderr)
+        call_command('prune_view_history', stdout=self.stdout, stderr=self.stderr)
+        call_command('update_sales_report', stdout=self.stdout, stderr=self.stderr)
+        self.stdout.write(self.style.SUCCESS('✅ Maintenance done!'))
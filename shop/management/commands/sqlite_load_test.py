@@ -0,0 +1,69 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from shop.db import apply_pragmas, get_pragmas
+
+
+class Command(BaseCommand):
+    help = 'Concurrent view-counter writes and catalog reads on a scratch SQLite file, default vs tuned pragmas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--operations', type=int, default=200, help='Statements per thread')
+
+    def handle(self, *args, **options):
+        self.results = {}
+        for label, pragmas in (('default', {}), ('tuned', get_pragmas())):
+            result = self.run(pragmas, options['writers'], options['readers'], options['operations'])
+            self.results[label] = result
+            self.stdout.write(
+                f"{label:<8} {result['operations']} ok, {result['locked']} 'database is locked' "
+                f"in {result['seconds']:.2f}s"
+            )
+
+    def run(self, pragmas, writers, readers, operations):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'load.sqlite3')
+            setup = sqlite3.connect(path, isolation_level=None)
+            apply_pragmas(setup.cursor(), pragmas)
+            setup.execute('CREATE TABLE product (id INTEGER PRIMARY KEY, views INTEGER NOT NULL)')
+            setup.executemany('INSERT INTO product VALUES (?, 0)', [(i,) for i in range(100)])
+            setup.close()
+
+            counts = {'operations': 0, 'locked': 0}
+            lock = threading.Lock()
+
+            def worker(statement):
+                # Autocommit like Django, no timeout unless the pragmas set one
+                db = sqlite3.connect(path, isolation_level=None, timeout=0, check_same_thread=False)
+                apply_pragmas(db.cursor(), pragmas)
+                ok = locked = 0
+                for i in range(operations):
+                    try:
+                        db.execute(statement, (i % 100,)).fetchall()
+                        ok += 1
+                    except sqlite3.OperationalError as e:
+                        if 'locked' not in str(e):
+                            raise
+                        locked += 1
+                db.close()
+                with lock:
+                    counts['operations'] += ok
+                    counts['locked'] += locked
+
+            threads = [threading.Thread(target=worker, args=('UPDATE product SET views = views + 1 WHERE id = ?',))
+                       for _ in range(writers)]
+            threads += [threading.Thread(target=worker, args=('SELECT SUM(views) FROM product WHERE id >= ?',))
+                        for _ in range(readers)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            counts['seconds'] = time.perf_counter() - start
+        return counts
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from shop.rankings import get_state, is_due, update_rankings
+
+
+class Command(BaseCommand):
+    help = ('Add new views, ratings and orders to the trending/bestseller rankings. '
+            "Safe to run every minute from cron, it skips until SHOP_RANKINGS['REFRESH_INTERVAL'] has passed")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Run even if the refresh interval has not passed')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recompute the rankings from every order (implies --force)')
+
+    def handle(self, *args, **options):
+        if not (options['force'] or options['rebuild']) and not is_due(get_state()):
+            self.stdout.write('Rankings are fresh, skipping')
+            return
+        updated = update_rankings(rebuild=options['rebuild'])
+        self.stdout.write(self.style.SUCCESS(f'✅ Updated the rankings of {updated} products!'))
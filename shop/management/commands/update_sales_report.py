@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from shop.reports import refresh_sales
+
+
+class Command(BaseCommand):
+    help = 'Add the orders placed since the last run to the daily/product/category sales tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recount every order (picks up orders cancelled after they were counted)')
+
+    def handle(self, *args, **options):
+        counted = refresh_sales(rebuild=options['rebuild'])
+        self.stdout.write(self.style.SUCCESS(f'✅ Counted {counted} new orders in the sales report!'))
@@ -0,0 +1,183 @@
+"""
+Per-request SQL, template and view timings.
+
+RequestMetricsMiddleware wraps every request in record(), which counts and
+times the queries of all database connections (execute_wrapper) and the
+template renders (TimedDjangoTemplates, the template backend in settings).
+The numbers go to the Server-Timing header, a `shop.requests` log line and
+a rolling window of samples per URL name, dumped by the staff metrics view.
+
+    db        SQL time, desc holds the query count
+    template  top level template renders (lazy querysets count in db too)
+    view      everything else in the view and the middlewares below
+    total
+
+The windows live in process memory, every worker keeps its own.
+"""
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django.template.exceptions import TemplateDoesNotExist
+
+# Upper bounds (ms) of the latency histogram buckets
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'SERVER_TIMING': True,
+    'WINDOW': 500,
+}
+
+_current = ContextVar('shop_request_timer', default=None)
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'SHOP_REQUEST_METRICS', {})}
+
+
+class RequestTimer:
+    """Query count and timings of one request, in seconds"""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql = 0.0
+        self.template = 0.0
+        self.total = 0.0
+        self._rendering = False
+        self._start = time.perf_counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql += time.perf_counter() - start
+
+    @contextmanager
+    def rendering(self):
+        # Templates rendered from inside a template are part of its time
+        if self._rendering:
+            yield
+            return
+        self._rendering = True
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.template += time.perf_counter() - start
+            self._rendering = False
+
+    @property
+    def view(self):
+        return max(self.total - self.sql - self.template, 0.0)
+
+    def as_dict(self):
+        """Timings in milliseconds"""
+        return {
+            'queries': self.queries,
+            'db_ms': round(self.sql * 1000, 2),
+            'template_ms': round(self.template * 1000, 2),
+            'view_ms': round(self.view * 1000, 2),
+            'total_ms': round(self.total * 1000, 2),
+        }
+
+    def server_timing(self):
+        return (f'db;dur={self.sql * 1000:.1f};desc="{self.queries} queries", '
+                f'template;dur={self.template * 1000:.1f}, '
+                f'view;dur={self.view * 1000:.1f}, '
+                f'total;dur={self.total * 1000:.1f}')
+
+
+@contextmanager
+def record():
+    """Time the block, query counting covers every database alias"""
+    timer = RequestTimer()
+    token = _current.set(timer)
+    try:
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(timer))
+            yield timer
+    finally:
+        timer.total = time.perf_counter() - timer._start
+        _current.reset(token)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        timer = _current.get()
+        if timer is None:
+            return super().render(context, request)
+        with timer.rendering():
+            return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates backend whose renders are timed by record()"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class RequestMetrics:
+    """Rolling window of request samples per URL name, thread safe"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def add(self, name, timer):
+        sample = timer.as_dict()
+        with self._lock:
+            if name not in self._samples:
+                self._samples[name] = deque(maxlen=get_config()['WINDOW'])
+            self._samples[name].append(sample)
+
+    def clear(self):
+        with self._lock:
+            self._samples = {}
+
+    def summary(self, samples):
+        summary = {'count': len(samples)}
+        for field in ('queries', 'db_ms', 'template_ms', 'total_ms'):
+            values = sorted(sample[field] for sample in samples)
+            summary[field] = {
+                'p50': percentile(values, 0.50),
+                'p95': percentile(values, 0.95),
+                'max': values[-1],
+            }
+        histogram = dict.fromkeys([f'<={bound}ms' for bound in LATENCY_BUCKETS] + [f'>{LATENCY_BUCKETS[-1]}ms'], 0)
+        for sample in samples:
+            bound = next((bound for bound in LATENCY_BUCKETS if sample['total_ms'] <= bound), None)
+            histogram[f'<={bound}ms' if bound else f'>{LATENCY_BUCKETS[-1]}ms'] += 1
+        summary['latency_histogram'] = histogram
+        return summary
+
+    def snapshot(self):
+        """{url_name: summary} of the current windows"""
+        with self._lock:
+            samples = {name: list(window) for name, window in self._samples.items()}
+        return {name: self.summary(window) for name, window in sorted(samples.items())}
+
+
+request_metrics = RequestMetrics()
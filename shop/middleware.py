@@ -0,0 +1,67 @@
+import logging
+
+from django.conf import settings
+
+from .metrics import get_config, record, request_metrics
+from .routers import pin, reads_replica, use_primary
+
+logger = logging.getLogger('shop.requests')
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_COOKIE = 'pin_primary'
+
+
+class PrimaryPinningMiddleware:
+    """
+    Read from the primary, except in the catalog views (see routers.py) when
+    the client hasn't written anything during the sticky window
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        writes = request.method not in SAFE_METHODS
+        request.pinned_to_primary = writes or PIN_COOKIE in request.COOKIES
+        # Scopes the pin(False) of process_view() to the request
+        with use_primary():
+            response = self.get_response(request)
+        if writes:
+            # The cookie expires with the sticky window
+            response.set_cookie(PIN_COOKIE, '1', max_age=getattr(settings, 'SHOP_REPLICA_STICKY_SECONDS', 5),
+                                httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not request.pinned_to_primary and reads_replica(request.resolver_match.view_name):
+            pin(False)
+
+
+class RequestMetricsMiddleware:
+    """Query count and timings per request, see metrics.py"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = get_config()
+        if not config['ENABLED']:
+            return self.get_response(request)
+
+        with record() as timer:
+            response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        name = (match.view_name if match else None) or 'unresolved'
+        request_metrics.add(name, timer)
+        metrics = timer.as_dict()
+        logger.info(
+            '%s %s view=%s status=%s queries=%d db=%.1fms template=%.1fms view_time=%.1fms total=%.1fms',
+            request.method, request.path, name, response.status_code, metrics['queries'],
+            metrics['db_ms'], metrics['template_ms'], metrics['view_ms'], metrics['total_ms'],
+            extra={'metrics': {'view': name, 'method': request.method, 'path': request.path,
+                               'status': response.status_code, **metrics}},
+        )
+        if config['SERVER_TIMING']:
+            response['Server-Timing'] = timer.server_timing()
+        return response
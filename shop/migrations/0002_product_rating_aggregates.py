@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:09
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    Rating = apps.get_model('shop', 'Rating')
+    ratings = Rating.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    Product.objects.update(
+        rating_count=Coalesce(Subquery(ratings.annotate(c=Count('id')).values('c')), Value(0)),
+        rating_sum=Coalesce(Subquery(ratings.annotate(s=Sum('rating')).values('s')), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('PROCESSING', 'Edit'), ('SHIPPED', 'Sent'), ('DELIVERED', 'Delivered'), ('CANCELLED', 'Canceled')], default='PENDING', max_length=20),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
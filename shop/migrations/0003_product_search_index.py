@@ -0,0 +1,38 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    from shop.search import normalize
+
+    Product = apps.get_model('shop', 'Product')
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS shop_product_fts USING fts5("
+        "name, color, description, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    rows = [
+        (product.pk, normalize(product.name), normalize(product.color), normalize(product.description))
+        for product in Product.objects.all()
+    ]
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            'INSERT INTO shop_product_fts (rowid, name, color, description) VALUES (%s, %s, %s, %s)',
+            rows,
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS shop_product_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0002_product_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:13
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def drop_duplicate_views(apps, schema_editor):
+    # Keep the latest row of every (user, product) pair before adding the unique constraint
+    ViewHistory = apps.get_model('shop', 'ViewHistory')
+    duplicates = (ViewHistory.objects.order_by().values('user', 'product')
+                  .annotate(latest=Max('id'), rows=models.Count('id')).filter(rows__gt=1))
+    for row in duplicates:
+        ViewHistory.objects.filter(user=row['user'], product=row['product']).exclude(id=row['latest']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0003_product_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='viewhistory',
+            name='viewed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(drop_duplicate_views, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='viewhistory',
+            unique_together={('user', 'product')},
+        ),
+        migrations.AddIndex(
+            model_name='viewhistory',
+            index=models.Index(fields=['user', '-viewed_at'], name='shop_viewhistory_recent_idx'),
+        ),
+    ]
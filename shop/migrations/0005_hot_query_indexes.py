@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:33
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0004_viewhistory_upsert'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-created_at'], name='shop_order_user_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-created_at'], name='shop_product_active_new_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['category', 'price'], name='shop_product_active_cat_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(fields=['product', '-created_at'], name='shop_rating_product_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(fields=['user', '-created_at'], name='shop_rating_user_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='wishlist',
+            index=models.Index(fields=['user', '-added_at'], name='shop_wishlist_user_recent_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0005_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductNeighbor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbor_of', to='shop.product')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='shop.product')),
+            ],
+            options={
+                'ordering': ['product', 'rank'],
+                'unique_together': {('product', 'rank')},
+            },
+        ),
+    ]
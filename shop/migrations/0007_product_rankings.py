@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:47
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0006_product_neighbors'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RankingState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_order_id', models.PositiveBigIntegerField(default=0)),
+                ('epoch', models.DateTimeField(default=django.utils.timezone.now)),
+                ('computed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProductRanking',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ranking', serialize=False, to='shop.product')),
+                ('trending_score', models.FloatField(default=0)),
+                ('bestseller_score', models.FloatField(default=0)),
+                ('views_seen', models.PositiveIntegerField(default=0)),
+                ('ratings_seen', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-trending_score'], name='shop_ranking_trending_idx'), models.Index(fields=['-bestseller_score'], name='shop_ranking_bestseller_idx')],
+            },
+        ),
+    ]
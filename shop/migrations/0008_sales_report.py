@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0007_product_rankings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategorySales',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='sales', serialize=False, to='shop.category')),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('items', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'ordering': ['-revenue'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('date', models.DateField(primary_key=True, serialize=False)),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('items', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SalesReportState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_order_id', models.PositiveBigIntegerField(default=0)),
+                ('computed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProductSales',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='sales', serialize=False, to='shop.product')),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('items', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-revenue'], name='shop_productsales_revenue_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+def create_unaccent(apps, schema_editor):
+    # Unused since migration 0010, the search table is filled with normalize()d text
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    from django.contrib.postgres.operations import UnaccentExtension
+
+    UnaccentExtension().database_forwards('shop', schema_editor, None, None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0008_sales_report'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_unaccent, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    from shop.search import PostgresSearchBackend
+
+    schema_editor.execute(
+        'CREATE TABLE IF NOT EXISTS shop_product_search ('
+        'product_id bigint PRIMARY KEY REFERENCES shop_product (id) ON DELETE CASCADE, '
+        'document tsvector NOT NULL)'
+    )
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS shop_product_search_document ON shop_product_search USING GIN (document)'
+    )
+    backend = PostgresSearchBackend()
+    Product = apps.get_model('shop', 'Product')
+    rows = [backend._row(product) for product in Product.objects.all()]
+    with schema_editor.connection.cursor() as cursor:
+        backend._upsert(cursor, rows)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP TABLE IF EXISTS shop_product_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0009_unaccent_extension'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
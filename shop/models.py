@@ -1,8 +1,18 @@
 
+from decimal import Decimal
+
+from django.core.cache import cache
 from django.db import models
+from django.db.models import Count, F, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 from django.utils.text import slugify
+from .counters import view_counter
+from .fragments import catalog_version
+
+CART_SUMMARY_TIMEOUT = 60 * 60
 
 
 class Category(models.Model):
@@ -25,6 +35,40 @@ class Category(models.Model):
         return self.name
 
 
+class ProductQuerySet(models.QuerySet):
+    """Product queries"""
+
+    # Columns rendered by the product cards (list, home, similar products)
+    CARD_FIELDS = [
+        'id', 'name', 'slug', 'description', 'price', 'stock', 'size', 'type', 'season',
+        'color', 'image_url', 'created_at', 'updated_at', 'rating_count', 'rating_sum',
+        'category__id', 'category__name', 'category__slug',
+    ]
+
+    def with_avg_rating(self):
+        """Annotate avg_rating computed in SQL"""
+        return self.annotate(avg_rating=Coalesce(
+            Cast('rating_sum', FloatField()) / NullIf(F('rating_count'), 0),
+            Value(0.0),
+            output_field=FloatField(),
+        ))
+
+    def catalog(self):
+        """Active products ready for card rendering in a single query"""
+        return (self.filter(is_active=True)
+                .select_related('category')
+                .only(*self.CARD_FIELDS)
+                .with_avg_rating())
+
+    def rebuild_rating_aggregates(self):
+        """Recompute rating_count/rating_sum from the ratings table"""
+        ratings = Rating.objects.filter(product=OuterRef('pk')).order_by().values('product')
+        return self.update(
+            rating_count=Coalesce(Subquery(ratings.annotate(c=Count('id')).values('c')), Value(0)),
+            rating_sum=Coalesce(Subquery(ratings.annotate(s=Sum('rating')).values('s')), Value(0)),
+        )
+
+
 class Product(models.Model):
     """Products"""
     SIZE_CHOICES = [
@@ -67,9 +111,23 @@ class Product(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
     views = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = ProductQuerySet.as_manager()
 
     class Meta:
         ordering = ['-created_at']
+        # Partial indexes: the catalog filters on `WHERE is_active`, which SQLite
+        # can't match against an (is_active, ...) index but does match this condition
+        indexes = [
+            # home and the default listing: active products, newest first
+            models.Index(fields=['-created_at'], condition=models.Q(is_active=True),
+                         name='shop_product_active_new_idx'),
+            # filtered listing: category + price range/sort
+            models.Index(fields=['category', 'price'], condition=models.Q(is_active=True),
+                         name='shop_product_active_cat_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -80,16 +138,113 @@ class Product(models.Model):
         return self.name
 
     def average_rating(self):
-        """AVG rating"""
-        ratings = self.ratings.all()
-        if ratings:
-            return sum([r.rating for r in ratings]) / len(ratings)
+        """AVG rating (from the denormalized rating columns)"""
+        if self.rating_count:
+            return self.rating_sum / self.rating_count
         return 0
 
     def increment_views(self):
-        """Increase of views"""
-        Product.objects.filter(id=self.id).update(views=models.F('views') + 1)
-        self.refresh_from_db()
+        """Increase of views (buffered, written back by shop.counters)"""
+        view_counter.add(self.id)
+        self.views += 1
+
+
+class ProductNeighbor(models.Model):
+    """Precomputed similar products, top-K per product (see recommendations.py)"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='neighbors')
+    neighbor = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='neighbor_of')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        # (product, rank) doubles as the index of the product_detail lookup
+        unique_together = ('product', 'rank')
+        ordering = ['product', 'rank']
+
+    def __str__(self):
+        return f"{self.product.name} -> {self.neighbor.name} (#{self.rank})"
+
+
+class ProductRanking(models.Model):
+    """Time-decayed popularity scores, maintained by rankings.update_rankings()"""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='ranking')
+    trending_score = models.FloatField(default=0)
+    bestseller_score = models.FloatField(default=0)
+    # Product counters already counted, the next run only adds what came after
+    views_seen = models.PositiveIntegerField(default=0)
+    ratings_seen = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-trending_score'], name='shop_ranking_trending_idx'),
+            models.Index(fields=['-bestseller_score'], name='shop_ranking_bestseller_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product.name} ({self.trending_score:.1f} / {self.bestseller_score:.1f})"
+
+
+class RankingState(models.Model):
+    """Single row: where the last rankings run stopped"""
+    last_order_id = models.PositiveBigIntegerField(default=0)
+    epoch = models.DateTimeField(default=timezone.now)
+    computed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Rankings up to order {self.last_order_id}"
+
+
+class DailySales(models.Model):
+    """Revenue per day, maintained by reports.refresh_sales()"""
+    date = models.DateField(primary_key=True)
+    orders = models.PositiveIntegerField(default=0)
+    items = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['-date']
+
+    def __str__(self):
+        return f"{self.date}: €{self.revenue}"
+
+
+class ProductSales(models.Model):
+    """Revenue per product, maintained by reports.refresh_sales()"""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='sales')
+    orders = models.PositiveIntegerField(default=0)
+    items = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-revenue'], name='shop_productsales_revenue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product.name}: €{self.revenue}"
+
+
+class CategorySales(models.Model):
+    """Revenue per category (of the product when the order was counted)"""
+    category = models.OneToOneField(Category, on_delete=models.CASCADE, primary_key=True, related_name='sales')
+    orders = models.PositiveIntegerField(default=0)
+    items = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['-revenue']
+
+    def __str__(self):
+        return f"{self.category.name}: €{self.revenue}"
+
+
+class SalesReportState(models.Model):
+    """Single row: the last order counted in the sales tables"""
+    last_order_id = models.PositiveBigIntegerField(default=0)
+    computed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Sales up to order {self.last_order_id}"
 
 
 class UserProfile(models.Model):
@@ -116,6 +271,17 @@ class Rating(models.Model):
     class Meta:
         unique_together = ('product', 'user')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['product', '-created_at'], name='shop_rating_product_recent_idx'),
+            models.Index(fields=['user', '-created_at'], name='shop_rating_user_recent_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored value so saves can apply a delta to the product
+        instance._loaded_rating = instance.__dict__.get('rating')
+        return instance
 
     def __str__(self):
         return f"{self.user.username} - {self.product.name} - {self.rating} stars"
@@ -132,11 +298,44 @@ class Cart(models.Model):
 
     def get_total(self):
         """Total"""
-        return sum([item.get_subtotal() for item in self.items.all()])
+        return self.aggregate_items()['total']
 
     def get_items_count(self):
         """Quantity of products"""
-        return sum([item.quantity for item in self.items.all()])
+        return self.aggregate_items()['count']
+
+    def aggregate_items(self):
+        """Items count and total computed in SQL"""
+        summary = self.items.aggregate(
+            count=Sum('quantity'),
+            total=Sum(F('quantity') * F('product__price'), output_field=models.DecimalField(max_digits=12, decimal_places=2)),
+        )
+        return {'count': summary['count'] or 0, 'total': summary['total'] or Decimal('0.00')}
+
+    def get_items(self):
+        """Cart items with their products, in one query"""
+        return list(self.items.select_related('product').order_by('id'))
+
+    def summary_cache_key(self):
+        return f'shop:cart-summary:{self.pk}:{catalog_version()}'
+
+    def get_summary(self, items=None):
+        """{'count', 'total'} of the cart, cached until a cart mutation invalidates it"""
+        key = self.summary_cache_key()
+        summary = cache.get(key)
+        if summary is None:
+            if items is None:
+                summary = self.aggregate_items()
+            else:
+                summary = {
+                    'count': sum(item.quantity for item in items),
+                    'total': sum((item.get_subtotal() for item in items), Decimal('0.00')),
+                }
+            cache.set(key, summary, CART_SUMMARY_TIMEOUT)
+        return summary
+
+    def invalidate_summary(self):
+        cache.delete(self.summary_cache_key())
 
 
 class CartItem(models.Model):
@@ -164,6 +363,9 @@ class Wishlist(models.Model):
     class Meta:
         unique_together = ('user', 'product')
         ordering = ['-added_at']
+        indexes = [
+            models.Index(fields=['user', '-added_at'], name='shop_wishlist_user_recent_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.product.name}"
@@ -173,10 +375,15 @@ class ViewHistory(models.Model):
     """Views history"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='view_history')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
-    viewed_at = models.DateTimeField(auto_now_add=True)
+    viewed_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
         ordering = ['-viewed_at']
+        # One row per (user, product), the buffered ingestion upserts viewed_at
+        unique_together = ('user', 'product')
+        indexes = [
+            models.Index(fields=['user', '-viewed_at'], name='shop_viewhistory_recent_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} viewed {self.product.name}"
@@ -201,6 +408,9 @@ class Order(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='shop_order_user_recent_idx'),
+        ]
 
     def __str__(self):
         return f"Order {self.id} - {self.user.username}"
@@ -0,0 +1,75 @@
+"""
+Checkout: turns a cart into an order in one transaction.
+
+Stock is reserved with a single conditional UPDATE over all cart lines:
+
+    UPDATE shop_product SET stock = stock - CASE id WHEN .. THEN qty .. END
+    WHERE id IN (..) AND stock >= CASE id WHEN .. THEN qty .. END
+
+If fewer rows than cart lines were updated some product ran out, and the
+whole transaction is rolled back, so two concurrent checkouts can never sell
+the same unit twice.
+"""
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from .models import CartItem, Order, OrderItem, Product
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class EmptyCart(CheckoutError):
+    pass
+
+
+class OutOfStock(CheckoutError):
+    def __init__(self, products):
+        self.products = products
+        super().__init__(', '.join(product.name for product in products))
+
+
+def reserve_stock(quantities):
+    """Decrement stock for {product_id: quantity}, all or nothing, raises OutOfStock"""
+    wanted = Case(
+        *[When(id=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+        output_field=IntegerField(),
+    )
+    with transaction.atomic():
+        updated = (Product.objects.filter(id__in=quantities, is_active=True, stock__gte=wanted)
+                   .update(stock=F('stock') - wanted, updated_at=timezone.now()))
+        if updated == len(quantities):
+            return
+        transaction.set_rollback(True)
+
+    # Read after the rollback so the partial reservation isn't counted
+    products = Product.objects.filter(id__in=quantities).only('id', 'name', 'stock', 'is_active')
+    raise OutOfStock([
+        product for product in products
+        if not product.is_active or product.stock < quantities[product.id]
+    ])
+
+
+def place_order(user, cart, shipping_address):
+    """Create the order of a cart, reserve its stock and empty the cart"""
+    with transaction.atomic():
+        items = list(CartItem.objects.filter(cart=cart).select_related('product'))
+        if not items:
+            raise EmptyCart()
+
+        reserve_stock({item.product_id: item.quantity for item in items})
+
+        order = Order.objects.create(
+            user=user,
+            total=sum(item.product.price * item.quantity for item in items),
+            shipping_address=shipping_address,
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=item.product, quantity=item.quantity, price=item.product.price)
+            for item in items
+        ])
+        CartItem.objects.filter(cart=cart).delete()
+    cart.invalidate_summary()
+    return order
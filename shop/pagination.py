@@ -0,0 +1,153 @@
+"""
+Keyset (cursor) pagination for the product catalog.
+
+Instead of COUNT(*) + OFFSET, a page is fetched with a WHERE on the sort key
+of the last row seen, with the id as tie-breaker:
+
+    ORDER BY price, id  ->  WHERE price > %s OR (price = %s AND id > %s)
+
+Cursors are opaque urlsafe base64 tokens carried in the querystring. The total
+is not needed to paginate; when a page shows it, it is cached per filter
+signature.
+"""
+import base64
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+from .fragments import catalog_version
+from .models import Product
+
+# sort_by -> (field, descending), the id tie-breaker follows the same direction
+CURSOR_ORDERINGS = {
+    'price_asc': ('price', False),
+    'price_desc': ('price', True),
+    'name_asc': ('name', False),
+    'name_desc': ('name', True),
+    'newest': ('created_at', True),
+    '': ('created_at', True),
+}
+
+# Query parameters that move through the result set without changing it
+NAVIGATION_PARAMS = {'page', 'cursor', 'pagination', 'sort_by'}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def cursor_querystring(params, cursor):
+    """Querystring of the catalog page at `cursor`, keeping the filters"""
+    query = params.copy()
+    query.pop('page', None)
+    query['pagination'] = 'cursor'
+    query['cursor'] = cursor
+    return query.urlencode()
+
+
+def encode_cursor(values, backwards=False):
+    payload = json.dumps({'v': values, 'b': backwards}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return payload['v'], bool(payload['b'])
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor(cursor)
+
+
+def filter_signature(params):
+    """Stable hash of the filters of a catalog querystring"""
+    items = sorted((key, value) for key, values in params.lists()
+                   if key not in NAVIGATION_PARAMS for value in values if value)
+    return hashlib.sha1(json.dumps(items).encode()).hexdigest()
+
+
+def cached_count(queryset, params):
+    """Result count cached per filter signature"""
+    key = f'shop:catalog-count:{catalog_version()}:{filter_signature(params)}'
+    count = cache.get(key)
+    if count is None:
+        count = queryset.order_by().count()
+        cache.set(key, count, getattr(settings, 'SHOP_CATALOG_COUNT_TIMEOUT', 300))
+    return count
+
+
+class CursorPage:
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Paginates a queryset on (field, id) for one of CURSOR_ORDERINGS"""
+
+    def __init__(self, queryset, sort_by, per_page):
+        self.field, self.descending = CURSOR_ORDERINGS[sort_by]
+        self.queryset = queryset
+        self.per_page = per_page
+
+    def ordering(self, reverse=False):
+        descending = self.descending != reverse
+        prefix = '-' if descending else ''
+        return [f'{prefix}{self.field}', f'{prefix}id']
+
+    def after(self, values, reverse=False):
+        """Rows strictly after `values` in (reversed) ordering"""
+        try:
+            value = Product._meta.get_field(self.field).to_python(values[0])
+            pk = int(values[1])
+        except (ValidationError, ValueError, TypeError, IndexError, KeyError):
+            raise InvalidCursor(values)
+        lookup = 'lt' if self.descending != reverse else 'gt'
+        return Q(**{f'{self.field}__{lookup}': value}) | Q(**{self.field: value, f'id__{lookup}': pk})
+
+    def key(self, obj):
+        value = getattr(obj, self.field)
+        return [value.isoformat() if hasattr(value, 'isoformat') else str(value), obj.pk]
+
+    def get_page(self, cursor=None):
+        values, backwards = decode_cursor(cursor) if cursor else (None, False)
+        queryset = self.queryset.order_by(*self.ordering(reverse=backwards))
+        if values is not None:
+            queryset = queryset.filter(self.after(values, reverse=backwards))
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+
+        if not rows:
+            return CursorPage(rows, None, None)
+        # Moving forward from a cursor there is always a previous page and vice versa
+        has_next = has_more if not backwards else True
+        has_previous = has_more if backwards else values is not None
+        return CursorPage(
+            rows,
+            encode_cursor(self.key(rows[-1])) if has_next else None,
+            encode_cursor(self.key(rows[0]), backwards=True) if has_previous else None,
+        )
@@ -0,0 +1,154 @@
+"""
+Trending and bestseller rankings for the home page.
+
+Both scores decay exponentially, with their own half-life. They are stored
+with forward decay: an event at time t adds
+
+    weight * 2 ** ((t - epoch) / half_life)
+
+so older events lose weight relative to newer ones without the stored
+scores ever being decayed. Each run only adds the events since the previous
+one, and only touches the products that had some:
+
+    views     Product.views - views_seen            (trending)
+    ratings   Product.rating_count - ratings_seen   (trending)
+    orders    OrderItem quantities after last_order_id (trending, bestsellers)
+
+Orders are taken by id, so an order whose transaction commits after one
+with a higher id would be skipped for good. Only orders older than
+ORDER_LAG seconds are counted, which covers any checkout shorter than
+that; update_rankings --rebuild recounts everything if one was missed.
+
+Once the exponent gets large every score is rescaled in one UPDATE and the
+epoch moves to the present. home reads the top products with one indexed
+query per ranking.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max, Q
+from django.utils import timezone
+
+from .models import Order, OrderItem, Product, ProductRanking, RankingState
+
+DEFAULTS = {
+    # Seconds between runs of update_rankings (when not forced)
+    'REFRESH_INTERVAL': 5 * 60,
+    'TRENDING_HALF_LIFE': timedelta(days=3),
+    'BESTSELLER_HALF_LIFE': timedelta(days=30),
+    'WEIGHTS': {'views': 1.0, 'ratings': 5.0, 'orders': 10.0},
+    # Orders younger than this (seconds) wait for the next run, their ids may not all be committed yet
+    'ORDER_LAG': 60,
+}
+
+# Half-lives after which the scores are rescaled, 2 ** 200 is far from float overflow
+RESCALE_AFTER = 200
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'SHOP_RANKINGS', {})}
+
+
+def growth(when, epoch, half_life):
+    return 2 ** ((when - epoch) / half_life)
+
+
+def get_state():
+    state, _ = RankingState.objects.get_or_create(pk=1)
+    return state
+
+
+def is_due(state, now=None, config=None):
+    config = config or get_config()
+    now = now or timezone.now()
+    return (state.computed_at is None or
+            (now - state.computed_at).total_seconds() >= config['REFRESH_INTERVAL'])
+
+
+def rescale(state, now, config):
+    """Move the epoch to now, dividing the scores by their growth so far"""
+    ProductRanking.objects.update(
+        trending_score=F('trending_score') / growth(now, state.epoch, config['TRENDING_HALF_LIFE']),
+        bestseller_score=F('bestseller_score') / growth(now, state.epoch, config['BESTSELLER_HALF_LIFE']),
+    )
+    state.epoch = now
+
+
+def update_rankings(now=None, config=None, batch_size=5000, rebuild=False):
+    """Add the events since the last run, returns the number of products updated"""
+    config = config or get_config()
+    weights = config['WEIGHTS']
+    now = now or timezone.now()
+
+    with transaction.atomic():
+        state = get_state()
+        if rebuild:
+            # Every order again, views and ratings count as happening now
+            ProductRanking.objects.all().delete()
+            state.last_order_id = 0
+            state.epoch = now
+        if (now - state.epoch) / config['TRENDING_HALF_LIFE'] > RESCALE_AFTER:
+            rescale(state, now, config)
+        trending_now = growth(now, state.epoch, config['TRENDING_HALF_LIFE'])
+
+        # {product_id: [trending, bestseller]} added by this run
+        added = defaultdict(lambda: [0.0, 0.0])
+        counters = {}
+
+        # Views and ratings only come as counters, they count as happening now
+        changed = Product.objects.filter(
+            Q(ranking__isnull=True, views__gt=0) | Q(ranking__isnull=True, rating_count__gt=0) |
+            Q(views__gt=F('ranking__views_seen')) | Q(rating_count__gt=F('ranking__ratings_seen'))
+        ).values_list('id', 'views', 'rating_count', 'ranking__views_seen', 'ranking__ratings_seen')
+        for product_id, views, ratings, views_seen, ratings_seen in changed.iterator(chunk_size=batch_size):
+            events = (weights['views'] * max(views - (views_seen or 0), 0) +
+                      weights['ratings'] * max(ratings - (ratings_seen or 0), 0))
+            added[product_id][0] += events * trending_now
+            counters[product_id] = (views, ratings)
+
+        settled = now - timedelta(seconds=config['ORDER_LAG'])
+        last_order_id = (Order.objects.filter(id__gt=state.last_order_id, created_at__lte=settled)
+                         .aggregate(last=Max('id'))['last'] or state.last_order_id)
+        items = (OrderItem.objects.filter(order_id__gt=state.last_order_id, order_id__lte=last_order_id)
+                 .exclude(order__status='CANCELLED')
+                 .values_list('product_id', 'quantity', 'order__created_at'))
+        for product_id, quantity, created_at in items.iterator(chunk_size=batch_size):
+            added[product_id][0] += (weights['orders'] * quantity *
+                                     growth(created_at, state.epoch, config['TRENDING_HALF_LIFE']))
+            added[product_id][1] += quantity * growth(created_at, state.epoch, config['BESTSELLER_HALF_LIFE'])
+
+        existing = ProductRanking.objects.in_bulk(list(added))
+        rows = []
+        for product_id, (trending, bestseller) in added.items():
+            current = existing.get(product_id) or ProductRanking(product_id=product_id)
+            views, ratings = counters.get(product_id, (current.views_seen, current.ratings_seen))
+            rows.append(ProductRanking(
+                product_id=product_id,
+                trending_score=current.trending_score + trending,
+                bestseller_score=current.bestseller_score + bestseller,
+                views_seen=views,
+                ratings_seen=ratings,
+            ))
+        ProductRanking.objects.bulk_create(
+            rows,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['product'],
+            update_fields=['trending_score', 'bestseller_score', 'views_seen', 'ratings_seen'],
+        )
+
+        state.last_order_id = last_order_id
+        state.computed_at = now
+        state.save()
+    return len(rows)
+
+
+def trending_products(limit=8):
+    return Product.objects.catalog().filter(ranking__trending_score__gt=0).order_by('-ranking__trending_score')[:limit]
+
+
+def bestsellers(limit=8):
+    return (Product.objects.catalog().filter(ranking__bestseller_score__gt=0)
+            .order_by('-ranking__bestseller_score')[:limit])
@@ -0,0 +1,151 @@
+"""
+Similar products, precomputed into the ProductNeighbor table.
+
+Similarity of two active products is
+
+    score = cosine(co-occurrence) + ATTRIBUTE_WEIGHT * attribute overlap
+
+Co-occurrence counts how often the products appear in the same basket: an
+order, a user's wishlist or a user's recent views (weighted by BASKETS).
+Baskets are walked once and the counts kept sparse, only pairs that were
+seen together are stored. Long baskets are cut to their MAX_BASKET most
+recent products, which bounds the pairs per basket.
+
+Attribute overlap is the share of category, type, season and color the
+products have in common. To avoid comparing every pair, the attribute
+candidates of a product are the most viewed products of the buckets it
+belongs to (same category + type + season + color, same category + type, ...).
+
+build_neighbors() replaces the whole table, product_detail then reads the
+top products with a single indexed lookup.
+"""
+import heapq
+import math
+from collections import defaultdict
+from itertools import combinations, groupby
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import OrderItem, Product, ProductNeighbor, ViewHistory, Wishlist
+
+DEFAULTS = {
+    'TOP_K': 8,
+    'MAX_BASKET': 30,
+    'ATTRIBUTE_WEIGHT': 0.25,
+    # Weight of a co-occurrence per basket kind
+    'BASKETS': {'orders': 3.0, 'wishlists': 2.0, 'views': 1.0},
+}
+
+ATTRIBUTES = ('category_id', 'type', 'season', 'color')
+
+# Attribute buckets, most specific first
+BUCKETS = [
+    ('category_id', 'type', 'season', 'color'),
+    ('category_id', 'type', 'season'),
+    ('category_id', 'type', 'color'),
+    ('category_id', 'season', 'color'),
+    ('category_id', 'type'),
+    ('category_id', 'season'),
+    ('category_id', 'color'),
+    ('category_id',),
+]
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'SHOP_RECOMMENDATIONS', {})}
+
+
+def baskets(max_basket):
+    """(kind, [product_id, ...]) of every order, wishlist and view history"""
+    sources = {
+        'orders': OrderItem.objects.order_by('order_id', '-id').values_list('order_id', 'product_id'),
+        'wishlists': Wishlist.objects.order_by('user_id', '-added_at').values_list('user_id', 'product_id'),
+        'views': ViewHistory.objects.order_by('user_id', '-viewed_at').values_list('user_id', 'product_id'),
+    }
+    for kind, rows in sources.items():
+        for _, group in groupby(rows.iterator(chunk_size=5000), key=lambda row: row[0]):
+            products = list(dict.fromkeys(product_id for _, product_id in group))[:max_basket]
+            if len(products) > 1:
+                yield kind, products
+
+
+def co_occurrence(active_ids, config):
+    """({product_id: {other_id: weight}}, {product_id: total weight}) over the baskets"""
+    pairs = defaultdict(lambda: defaultdict(float))
+    totals = defaultdict(float)
+    for kind, products in baskets(config['MAX_BASKET']):
+        weight = config['BASKETS'].get(kind, 0)
+        products = [product_id for product_id in products if product_id in active_ids]
+        if not weight or len(products) < 2:
+            continue
+        for product_id in products:
+            totals[product_id] += weight
+        for a, b in combinations(products, 2):
+            pairs[a][b] += weight
+            pairs[b][a] += weight
+    return pairs, totals
+
+
+def attribute_overlap(a, b):
+    return sum(a[name] == b[name] for name in ATTRIBUTES) / len(ATTRIBUTES)
+
+
+def compute_neighbors(config=None):
+    """{product_id: [(score, neighbor_id), ...]} best first"""
+    config = config or get_config()
+    top_k = config['TOP_K']
+    products = {
+        row['id']: row for row in
+        Product.objects.filter(is_active=True).order_by('-views', 'id').values('id', *ATTRIBUTES)
+    }
+    pairs, totals = co_occurrence(products, config)
+
+    # The top_k + 1 most viewed products of every bucket (the product itself may be one)
+    buckets = defaultdict(list)
+    for product in products.values():
+        for fields in BUCKETS:
+            members = buckets[(fields, tuple(product[name] for name in fields))]
+            if len(members) <= top_k:
+                members.append(product['id'])
+
+    neighbors = {}
+    for product_id, product in products.items():
+        candidates = set(pairs.get(product_id, ()))
+        for fields in BUCKETS:
+            candidates.update(buckets[(fields, tuple(product[name] for name in fields))])
+        candidates.discard(product_id)
+
+        scored = []
+        for other_id in candidates:
+            cosine = 0.0
+            if other_id in pairs.get(product_id, ()):
+                cosine = pairs[product_id][other_id] / math.sqrt(totals[product_id] * totals[other_id])
+            score = cosine + config['ATTRIBUTE_WEIGHT'] * attribute_overlap(product, products[other_id])
+            scored.append((round(score, 6), -other_id))
+        neighbors[product_id] = [(score, -negated_id) for score, negated_id in heapq.nlargest(top_k, scored)]
+    return neighbors
+
+
+def build_neighbors(config=None, batch_size=5000):
+    """Recompute the ProductNeighbor table, returns the number of rows"""
+    neighbors = compute_neighbors(config)
+    rows = [
+        ProductNeighbor(product_id=product_id, neighbor_id=neighbor_id, rank=rank, score=score)
+        for product_id, ranked in neighbors.items()
+        for rank, (score, neighbor_id) in enumerate(ranked)
+    ]
+    with transaction.atomic():
+        ProductNeighbor.objects.all().delete()
+        ProductNeighbor.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+def similar_products(product, limit=4):
+    """Precomputed neighbors, same category products until the table is built"""
+    similar = list(Product.objects.catalog()
+                   .filter(neighbor_of__product=product, neighbor_of__rank__lt=limit)
+                   .order_by('neighbor_of__rank'))
+    if similar:
+        return similar
+    return list(Product.objects.catalog().filter(category_id=product.category_id).exclude(id=product.id)[:limit])
@@ -0,0 +1,192 @@
+"""
+Staff sales reports: streaming order export and revenue aggregates.
+
+The export is one CSV row per OrderItem, with its order's columns repeated,
+read chunk_size rows at a time with iterator() so no result set is ever
+held in memory. csv_stream() yields the rows one by one for a
+StreamingHttpResponse, write_orders() writes them to a file.
+
+Revenue per day, product and category is kept in the DailySales,
+ProductSales and CategorySales tables. refresh_sales() only aggregates the
+orders after SalesReportState.last_order_id, with one GROUP BY query per
+table, and adds the results to the stored rows. Cancelled orders are left
+out when they are counted; an order cancelled afterwards stays counted
+until refresh_sales(rebuild=True).
+
+Orders are only counted once they are ORDER_LAG seconds old: ids are
+handed out at insert time, so an order committed after one with a higher
+id would otherwise be skipped for good. update_sales_report --rebuild
+recounts everything if a checkout ever took longer than that.
+"""
+import csv
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import CategorySales, DailySales, Order, OrderItem, ProductSales, SalesReportState
+from .routers import use_primary
+
+DEFAULTS = {
+    # Seconds between refreshes when the report is read
+    'REFRESH_INTERVAL': 60,
+    # Orders younger than this (seconds) wait for the next refresh, their ids may not all be committed yet
+    'ORDER_LAG': 60,
+}
+
+EXPORT_FIELDS = ['order_id', 'created_at', 'status', 'username', 'email', 'shipping_address', 'order_total',
+                 'product_slug', 'product_name', 'category', 'quantity', 'price', 'line_total']
+COLUMNS = ['order_id', 'order__created_at', 'order__status', 'order__user__username', 'order__user__email',
+           'order__shipping_address', 'order__total', 'product__slug', 'product__name', 'product__category__slug',
+           'quantity', 'price']
+
+LINE_TOTAL = ExpressionWrapper(F('price') * F('quantity'),
+                               output_field=DecimalField(max_digits=14, decimal_places=2))
+SUMMARIES = [
+    (DailySales, TruncDate('order__created_at')),
+    (ProductSales, F('product_id')),
+    (CategorySales, F('product__category_id')),
+]
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'SHOP_SALES_REPORT', {})}
+
+
+def order_items(since=None, until=None, status=None):
+    """OrderItems of the orders created between two dates (inclusive)"""
+    items = OrderItem.objects.all()
+    if since:
+        items = items.filter(order__created_at__date__gte=since)
+    if until:
+        items = items.filter(order__created_at__date__lte=until)
+    if status:
+        items = items.filter(order__status=status)
+    return items
+
+
+def export_rows(items=None, chunk_size=2000):
+    """Export rows (lists in EXPORT_FIELDS order), chunk_size items at a time"""
+    items = order_items() if items is None else items
+    for row in items.order_by('order_id', 'id').values_list(*COLUMNS).iterator(chunk_size=chunk_size):
+        row = list(row)
+        row[1] = row[1].isoformat()
+        row.append(row[-1] * row[-2])
+        yield row
+
+
+class Echo:
+    """File-like object that hands back what is written, for csv.writer"""
+    def write(self, value):
+        return value
+
+
+def csv_stream(rows):
+    """CSV lines of the export rows, the header first"""
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def write_orders(rows, stream):
+    """Write the export rows to a text stream as CSV, returns how many"""
+    writer = csv.writer(stream)
+    writer.writerow(EXPORT_FIELDS)
+    count = 0
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+    return count
+
+
+def get_state():
+    state, _ = SalesReportState.objects.get_or_create(pk=1)
+    return state
+
+
+def is_due(state, now=None, config=None):
+    config = config or get_config()
+    now = now or timezone.now()
+    return (state.computed_at is None or
+            (now - state.computed_at).total_seconds() >= config['REFRESH_INTERVAL'])
+
+
+def add_totals(model, key, items):
+    """Add the totals of items grouped by key to the rows of model"""
+    totals = (items.values(key=key)
+              .annotate(orders=Count('order_id', distinct=True), items=Sum('quantity'), revenue=Sum(LINE_TOTAL))
+              .order_by())
+    # An order is only ever counted once, so its counts can simply be added
+    rows = {row['key']: row for row in totals}
+    existing = model.objects.in_bulk(list(rows))
+    merged = []
+    for pk, row in rows.items():
+        current = existing.get(pk) or model(pk=pk)
+        merged.append(model(
+            pk=pk,
+            orders=current.orders + row['orders'],
+            items=current.items + row['items'],
+            revenue=current.revenue + row['revenue'],
+        ))
+    model.objects.bulk_create(
+        merged,
+        update_conflicts=True,
+        unique_fields=[model._meta.pk.name],
+        update_fields=['orders', 'items', 'revenue'],
+    )
+    return len(merged)
+
+
+def refresh_sales(rebuild=False, now=None, config=None):
+    """Count the orders placed since the last refresh, returns how many"""
+    config = config or get_config()
+    now = now or timezone.now()
+    with use_primary(), transaction.atomic():
+        state = get_state()
+        if rebuild:
+            for model, _ in SUMMARIES:
+                model.objects.all().delete()
+            state.last_order_id = 0
+
+        # Stop at the newest settled order, later ones wait for the next refresh
+        settled = now - timedelta(seconds=config['ORDER_LAG'])
+        last_order_id = (Order.objects.filter(id__gt=state.last_order_id, created_at__lte=settled)
+                         .aggregate(last=Max('id'))['last'] or state.last_order_id)
+        counted = (Order.objects.filter(id__gt=state.last_order_id, id__lte=last_order_id)
+                   .exclude(status='CANCELLED').count())
+        items = (OrderItem.objects.filter(order_id__gt=state.last_order_id, order_id__lte=last_order_id)
+                 .exclude(order__status='CANCELLED'))
+        if counted:
+            for model, key in SUMMARIES:
+                add_totals(model, key, items)
+
+        state.last_order_id = last_order_id
+        state.computed_at = now
+        state.save()
+    return counted
+
+
+def sales_report(days=30, limit=20, now=None):
+    """Revenue of the last `days` days, the top products and every category"""
+    state = get_state()
+    if is_due(state, now):
+        refresh_sales(now=now)
+        state = get_state()
+    since = timezone.localdate(now) - timedelta(days=days - 1)
+
+    def summary(row):
+        return {'orders': row.orders, 'items': row.items, 'revenue': str(row.revenue)}
+
+    return {
+        'last_order_id': state.last_order_id,
+        'computed_at': state.computed_at.isoformat(),
+        'daily': [{'date': row.date.isoformat(), **summary(row)}
+                  for row in DailySales.objects.filter(date__gte=since)],
+        'products': [{'slug': row.product.slug, 'name': row.product.name, **summary(row)}
+                     for row in ProductSales.objects.select_related('product').order_by('-revenue')[:limit]],
+        'categories': [{'slug': row.category.slug, 'name': row.category.name, **summary(row)}
+                       for row in CategorySales.objects.select_related('category')],
+    }
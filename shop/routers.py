@@ -0,0 +1,88 @@
+"""
+Primary/replica database routing.
+
+Reads go to settings.SHOP_REPLICA_DATABASE when one is configured, writes
+always go to `default`. Requests only read from the replica in the catalog
+views (REPLICA_VIEWS and the admin changelists), where a little lag doesn't
+matter; carts, checkout, dashboard and the rest read the primary. A catalog
+request that writes (any non GET/HEAD/OPTIONS method) is pinned to the
+primary too, and so are the requests of the same client during the sticky
+window that follows, so users read their own writes while the replica
+catches up (see PrimaryPinningMiddleware). Sessions and users are always
+read from the primary, and the replica is never migrated.
+
+Everything else reads the primary too: commands, jobs, the signal and
+request_finished handlers, and streamed responses consumed after the
+middleware. Most of them read rows they are about to update. A block that
+can live with lag may opt in with use_primary(False).
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+PRIMARY = 'default'
+
+# URL names of the views allowed to read from the replica
+REPLICA_VIEWS = {
+    'home', 'product_list', 'product_detail',
+    'api_products', 'api_product_detail', 'api_categories', 'api_facets',
+}
+# Apps whose reads never go to the replica (logins, sessions, permissions)
+PRIMARY_APPS = {'auth', 'sessions', 'contenttypes'}
+
+_pinned = ContextVar('shop_pinned_to_primary', default=True)
+
+
+def get_replica():
+    return getattr(settings, 'SHOP_REPLICA_DATABASE', None)
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+def reads_replica(view_name):
+    """Whether requests of a view may read from the replica"""
+    if view_name in getattr(settings, 'SHOP_REPLICA_VIEWS', REPLICA_VIEWS):
+        return True
+    return view_name.startswith('admin:') and view_name.endswith('_changelist')
+
+
+def pin(pinned=True):
+    """(Un)pin the rest of the current context, inside a use_primary() block"""
+    _pinned.set(pinned)
+
+
+@contextmanager
+def use_primary(pinned=True):
+    """Route the reads of the block to the primary (or the replica, pinned=False)"""
+    token = _pinned.set(pinned)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replica = get_replica()
+        if replica is None or is_pinned() or model._meta.app_label in PRIMARY_APPS:
+            return PRIMARY
+        return replica
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica is a copy of the primary, objects of both can be related
+        databases = {PRIMARY, get_replica()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema from the primary
+        if db != PRIMARY and db == get_replica():
+            return False
+        return None
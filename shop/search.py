@@ -0,0 +1,219 @@
+"""
+Product search backends.
+
+Every backend exposes the same interface: index()/index_many()/remove() keep
+the index in sync with products, search() narrows a Product queryset to the
+matches and annotates a `search_rank` (higher is more relevant).
+"""
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import Product
+
+
+def normalize(text):
+    """Lowercase and strip accents so that 'Παναθηναικος' matches 'Παναθηναϊκός'"""
+    decomposed = unicodedata.normalize('NFD', text or '')
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return unicodedata.normalize('NFC', stripped).casefold()
+
+
+def tokenize(query):
+    """Normalized words of a search query"""
+    return re.findall(r'\w+', normalize(query))
+
+
+class BaseSearchBackend:
+    """Fallback backend: LIKE scan, no index to maintain"""
+
+    def index(self, product):
+        pass
+
+    def index_many(self, products):
+        pass
+
+    def remove(self, product_id):
+        pass
+
+    def rebuild(self):
+        return 0
+
+    def no_results(self, queryset):
+        return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    def search(self, queryset, query):
+        words = query.split()
+        if not words:
+            return self.no_results(queryset)
+        for word in words:
+            queryset = queryset.filter(
+                Q(name__icontains=word) |
+                Q(description__icontains=word) |
+                Q(color__icontains=word)
+            )
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+class IndexedSearchBackend(BaseSearchBackend):
+    """Backend keeping the normalize()d columns of every product in a search table"""
+
+    def _connection(self):
+        return connections[router.db_for_write(Product)]
+
+    def _row(self, product):
+        return [product.pk, normalize(product.name), normalize(product.color), normalize(product.description)]
+
+    def _products(self):
+        return Product.objects.only('id', 'name', 'color', 'description').order_by().iterator(chunk_size=2000)
+
+
+class SQLiteFTSSearchBackend(IndexedSearchBackend):
+    """SQLite FTS5 index (table created by migration 0003)"""
+
+    table = 'shop_product_fts'
+    # bm25 column weights: name, color, description
+    weights = (10.0, 3.0, 1.0)
+
+    def index(self, product):
+        with self._connection().cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [product.pk])
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, name, color, description) VALUES (%s, %s, %s, %s)',
+                self._row(product),
+            )
+
+    def index_many(self, products):
+        rows = [self._row(product) for product in products]
+        with self._connection().cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [[row[0]] for row in rows])
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, name, color, description) VALUES (%s, %s, %s, %s)',
+                rows,
+            )
+
+    def remove(self, product_id):
+        with self._connection().cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [product_id])
+
+    def rebuild(self):
+        with self._connection().cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            rows = [self._row(product) for product in self._products()]
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, name, color, description) VALUES (%s, %s, %s, %s)',
+                rows,
+            )
+        return len(rows)
+
+    def match_expression(self, query):
+        # Every word must match, the last one as a prefix (search as you type)
+        words = tokenize(query)
+        if not words:
+            return ''
+        terms = [f'"{word}"' for word in words[:-1]] + [f'"{words[-1]}"*']
+        return ' AND '.join(terms)
+
+    def search(self, queryset, query):
+        expression = self.match_expression(query)
+        if not expression:
+            return self.no_results(queryset)
+
+        # The MATCH stays in SQL so filters, counts and pagination see every match.
+        # bm25() is lower-is-better, flip it so search_rank sorts descending
+        table, product_id = self.table, f'{Product._meta.db_table}.{Product._meta.pk.column}'
+        return queryset.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {table} WHERE {table} MATCH %s', [expression]),
+        ).annotate(search_rank=RawSQL(
+            f'SELECT -bm25({table}, %s, %s, %s) FROM {table} WHERE {table} MATCH %s AND rowid = {product_id}',
+            [*self.weights, expression],
+            output_field=FloatField(),
+        ))
+
+
+class PostgresSearchBackend(IndexedSearchBackend):
+    """
+    Postgres full text search over a stored tsvector (table and GIN index
+    created by migration 0010).
+
+    The document is built from the normalize()d columns, like the query
+    words, so both sides are lowercased and unaccented the same way.
+    """
+
+    table = 'shop_product_search'
+    config = 'simple'
+    # name, color and description weigh A, B and C
+    document = ("setweight(to_tsvector(%s::regconfig, %s), 'A') || "
+                "setweight(to_tsvector(%s::regconfig, %s), 'B') || "
+                "setweight(to_tsvector(%s::regconfig, %s), 'C')")
+
+    def _params(self, row):
+        product_id, *columns = row
+        return [product_id] + [param for column in columns for param in (self.config, column)]
+
+    def _upsert(self, cursor, rows):
+        cursor.executemany(
+            f'INSERT INTO {self.table} (product_id, document) VALUES (%s, {self.document}) '
+            f'ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document',
+            [self._params(row) for row in rows],
+        )
+
+    def index(self, product):
+        self.index_many([product])
+
+    def index_many(self, products):
+        rows = [self._row(product) for product in products]
+        with self._connection().cursor() as cursor:
+            self._upsert(cursor, rows)
+
+    def remove(self, product_id):
+        with self._connection().cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE product_id = %s', [product_id])
+
+    def rebuild(self):
+        with self._connection().cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            rows = [self._row(product) for product in self._products()]
+            self._upsert(cursor, rows)
+        return len(rows)
+
+    def search(self, queryset, query):
+        words = tokenize(query)
+        if not words:
+            return self.no_results(queryset)
+
+        expression = ' & '.join(words[:-1] + [f'{words[-1]}:*'])
+        table, product_id = self.table, f'{Product._meta.db_table}.{Product._meta.pk.column}'
+        return queryset.filter(id__in=RawSQL(
+            f'SELECT product_id FROM {table} WHERE document @@ to_tsquery(%s::regconfig, %s)',
+            [self.config, expression],
+        )).annotate(search_rank=RawSQL(
+            f'SELECT ts_rank(document, to_tsquery(%s::regconfig, %s)) FROM {table} WHERE product_id = {product_id}',
+            [self.config, expression],
+            output_field=FloatField(),
+        ))
+
+
+BACKENDS = {
+    'sqlite': 'shop.search.SQLiteFTSSearchBackend',
+    'postgresql': 'shop.search.PostgresSearchBackend',
+}
+
+_backend = None
+
+
+def get_search_backend():
+    """Backend from SHOP_SEARCH_BACKEND, or the one matching the database vendor"""
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'SHOP_SEARCH_BACKEND', None)
+        if path is None:
+            vendor = connections[router.db_for_write(Product)].vendor
+            path = BACKENDS.get(vendor, 'shop.search.BaseSearchBackend')
+        _backend = import_string(path)()
+    return _backend
@@ -0,0 +1,100 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db.backends.signals import connection_created
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from .carts import merge_session_cart
+from .context_processors import set_cart_count
+from .db import apply_pragmas
+from .fragments import bump_catalog_version, bump_version, bump_versions
+from .models import Cart, Category, Product, Rating
+from .search import get_search_backend
+
+
+@receiver(post_save, sender=Rating)
+def rating_saved(sender, instance, created, **kwargs):
+    """Keep Product.rating_count/rating_sum in sync with a saved rating"""
+    products = Product.objects.filter(pk=instance.product_id)
+    old_rating = getattr(instance, '_loaded_rating', None)
+
+    if created:
+        products.update(rating_count=F('rating_count') + 1, rating_sum=F('rating_sum') + instance.rating,
+                        updated_at=timezone.now())
+    elif old_rating is None:
+        # Previous value unknown (instance not loaded from the db), recount this product
+        products.rebuild_rating_aggregates()
+    elif old_rating != instance.rating:
+        products.update(rating_sum=F('rating_sum') + (instance.rating - old_rating), updated_at=timezone.now())
+
+    instance._loaded_rating = instance.rating
+
+
+@receiver(post_delete, sender=Rating)
+def rating_deleted(sender, instance, **kwargs):
+    """Remove a deleted rating from the product aggregates"""
+    Product.objects.filter(pk=instance.product_id).update(
+        rating_count=F('rating_count') - 1,
+        rating_sum=F('rating_sum') - instance.rating,
+        updated_at=timezone.now(),
+    )
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, update_fields=None, **kwargs):
+    """Reindex a product whose searchable text may have changed"""
+    if update_fields is not None and not {'name', 'color', 'description'} & set(update_fields):
+        return
+    get_search_backend().index(instance)
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    """Drop a deleted product from the search index"""
+    get_search_backend().remove(instance.pk)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance, **kwargs):
+    """Drop the cached cards and catalog counts of a changed product"""
+    bump_version(instance.pk)
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def rating_changed(sender, instance, **kwargs):
+    """The card stars depend on the ratings"""
+    bump_version(instance.product_id)
+
+
+@receiver(post_save, sender=Category)
+def category_changed(sender, instance, created, **kwargs):
+    """Cards, API payloads and facets show the category name"""
+    bump_catalog_version()
+    if not created:
+        instance.products.update(updated_at=timezone.now())
+        bump_versions(instance.products.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(user_logged_in)
+def load_cart(sender, request, user, **kwargs):
+    """Merge the visitor's session cart and seed the navbar cart badge"""
+    if request is None or not hasattr(request, 'session'):
+        return
+    merge_session_cart(request, user)
+    set_cart_count(request, sum(cart.get_summary()['count'] for cart in Cart.objects.filter(user=user)))
+
+
+@receiver(connection_created)
+def tune_sqlite(sender, connection, **kwargs):
+    """WAL, busy timeout and cache pragmas on every new SQLite connection"""
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            apply_pragmas(cursor)
@@ -14,7 +14,13 @@ function getCookie(name) {
     return cookieValue;
 }
 
-const csrftoken = getCookie('csrftoken');
+// The CSRF cookie is HttpOnly, base.html renders the token in a meta tag
+function getCsrfToken() {
+    const meta = document.querySelector('meta[name="csrf-token"]');
+    return meta ? meta.content : getCookie('csrftoken');
+}
+
+const csrftoken = getCsrfToken();
 
 // Setup AJAX to always send CSRF token
 $.ajaxSetup({
@@ -36,4 +42,55 @@ document.addEventListener('DOMContentLoaded', function() {
             }
         });
     });
-});
\ No newline at end of file
+});
+
+// Cart batching: rapid cart actions are coalesced into a single request to /cart/batch/
+const cartBatch = {
+    operations: [],
+    callbacks: [],
+    timer: null,
+    delay: 300,
+
+    push: function(operation, callback) {
+        const pending = this.operations.find(op =>
+            op.op === 'add' && operation.op === 'add' && op.product_id === operation.product_id);
+        if (pending) {
+            pending.quantity += operation.quantity;
+        } else {
+            this.operations.push(operation);
+        }
+        if (callback) {
+            this.callbacks.push(callback);
+        }
+        clearTimeout(this.timer);
+        this.timer = setTimeout(() => this.flush(), this.delay);
+    },
+
+    flush: function() {
+        const operations = this.operations;
+        const callbacks = this.callbacks;
+        this.operations = [];
+        this.callbacks = [];
+        this.timer = null;
+        if (operations.length === 0) {
+            return;
+        }
+
+        $.ajax({
+            url: '/cart/batch/',
+            type: 'POST',
+            contentType: 'application/json',
+            data: JSON.stringify({operations: operations}),
+            headers: {
+                'X-CSRFToken': getCsrfToken()
+            },
+            success: function(data) {
+                $('#navbar-cart-count').text(data.cart_count);
+                callbacks.forEach(callback => callback(null, data));
+            },
+            error: function(xhr) {
+                callbacks.forEach(callback => callback(xhr, null));
+            }
+        });
+    }
+};
@@ -14,36 +14,27 @@ function getCookie(name) {
     return cookieValue;
 }
 
+// Removals are sent through cartBatch (base.js), so quick successive clicks share one request
 function removeFromCart(itemId) {
     if (confirm('Remove the product?')) {
-        $.ajax({
-            url: `/cart/remove/${itemId}/`,
-            type: 'POST',
-            headers: {
-                'X-CSRFToken': getCookie('csrftoken')
-            },
-            success: function(data) {
-                if (data.success) {
-                    // Remove the item card from DOM
-                    $(`#item-${itemId}`).fadeOut(300, function() {
-                        $(this).remove();
+        cartBatch.push({op: 'remove', item_id: itemId}, function(xhr, data) {
+            if (xhr || !data.success) {
+                alert('Error removing product. Please try again.');
+                return;
+            }
+            // Remove the item card from DOM
+            $(`#item-${itemId}`).fadeOut(300, function() {
+                $(this).remove();
 
-                        // Update cart count and total
-                        $('#cart-count').text(data.cart_count);
-                        $('#cart-total').text(data.cart_total.toFixed(2));
+                // Update cart count and total
+                $('#cart-count').text(data.cart_count);
+                $('#cart-total').text(data.cart_total.toFixed(2));
 
-                        // If cart is empty, reload page to show empty message
-                        if (data.cart_count === 0) {
-                            location.reload();
-                        }
-                    });
-                } else {
-                    alert('Error removing product');
+                // If cart is empty, reload page to show empty message
+                if (data.cart_count === 0) {
+                    location.reload();
                 }
-            },
-            error: function() {
-                alert('Error removing product. Please try again.');
-            }
+            });
         });
     }
-}
\ No newline at end of file
+}
@@ -89,7 +89,7 @@ function submitRating(productId) {
         url: `/rating/add/${productId}/`,
         type: 'POST',
         headers: {
-            'X-CSRFToken': getCookie('csrftoken')
+            'X-CSRFToken': getCsrfToken()
         },
         data: {
             rating: rating,
@@ -116,28 +116,18 @@ function submitRating(productId) {
     });
 }
 
-// Add to Cart via AJAX
+// Add to Cart, rapid clicks are sent as one batch (see cartBatch in base.js)
 function addToCart(productId) {
-    $.ajax({
-        url: `/cart/add/${productId}/`,
-        type: 'POST',
-        headers: {
-            'X-CSRFToken': getCookie('csrftoken')
-        },
-        success: function(data) {
-            if (data.success) {
-                showNotification(data.message, 'success');
-                const cartCount = document.getElementById('cart-count');
-                if (cartCount) {
-                    cartCount.textContent = data.cart_count;
-                }
-            } else {
-                showNotification(data.message || 'Error adding product to cart', 'danger');
-            }
-        },
-        error: function(xhr) {
+    cartBatch.push({op: 'add', product_id: productId, quantity: 1}, function(xhr, data) {
+        if (xhr) {
             console.error('Error details:', xhr);
             showNotification('Error adding product to cart. Please try again.', 'danger');
+            return;
+        }
+        showNotification(data.message, 'success');
+        const cartCount = document.getElementById('cart-count');
+        if (cartCount) {
+            cartCount.textContent = data.cart_count;
         }
     });
-}
\ No newline at end of file
+}
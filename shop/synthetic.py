@@ -0,0 +1,223 @@
+"""
+Deterministic synthetic data for benchmarks and scale testing.
+
+Rows are generated from a seeded random.Random and written with bulk_create
+in batches, so the same seed always produces the same catalog. bulk_create
+skips save() and the signals, finish() brings the derived data up to date
+(rating aggregates, search index, cache versions) in one pass each.
+
+catalog() is the benchmark dataset, everything() adds the rest of the shop
+(nested categories, profiles, carts, wishlists, view history, orders) for
+generate_fake_data.
+"""
+import random
+from datetime import timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .fragments import bump_catalog_version
+from .models import Cart, CartItem, Category, Order, OrderItem, Product, Rating, UserProfile, ViewHistory, Wishlist
+from .search import get_search_backend
+
+BATCH_SIZE = 5000
+
+ADJECTIVES = ['Home', 'Away', 'Third', 'Retro', 'Classic', 'Training', 'Limited', 'Vintage',
+              'Official', 'Fan', 'Winter', 'Summer', 'Legend', 'Heritage', 'Pro']
+NOUNS = ['Jersey', 'Hoodie', 'Scarf', 'Cap', 'Tracksuit', 'Shorts', 'Jacket', 'Ball',
+         'Mug', 'Socks', 'Backpack', 'Beanie', 'Polo', 'T-Shirt', 'Flag']
+COLORS = ['Green', 'White', 'Black', 'Grey', 'Πράσινο', 'Λευκό']
+CITIES = ['Athens', 'Thessaloniki', 'Patra', 'Heraklion', 'Larissa', 'Volos', 'Ioannina', 'Chania']
+STREETS = ['Leoforos Alexandras', 'Panepistimiou', 'Ermou', 'Patision', 'Kifisias', 'Syngrou']
+WORDS = ['official', 'panathinaikos', 'season', 'breathable', 'fabric', 'clover', 'logo',
+         'stadium', 'supporters', 'embroidered', 'cotton', 'lightweight', 'warm', 'edition']
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class SyntheticData:
+    """Bulk generator, every method returns the ids of the rows it created"""
+
+    def __init__(self, seed=0, batch_size=BATCH_SIZE, stdout=None):
+        self.random = random.Random(seed)
+        self.batch_size = batch_size
+        self.stdout = stdout
+
+    def log(self, message):
+        if self.stdout is not None:
+            self.stdout.write(message)
+
+    def insert(self, model, rows):
+        """bulk_create a generator of instances in batches, returns the new ids"""
+        ids = []
+        for batch in batched(rows, self.batch_size):
+            ids += [obj.pk for obj in model.objects.bulk_create(batch)]
+        self.log(f'{model.__name__}: {len(ids)} rows')
+        return ids
+
+    def categories(self, count, depth=0):
+        """`count` categories, nested `depth` levels under a quarter of them as roots"""
+        roots = count if depth == 0 else max(1, count // 4)
+        sizes = [roots] + [(count - roots) // depth + (level < (count - roots) % depth) for level in range(depth)]
+
+        ids, parents, number = [], [None], 0
+        for size in sizes:
+            level = self.insert(Category, (
+                Category(name=f'Category {i}', slug=f'category-{i}', parent_id=self.random.choice(parents),
+                         description=' '.join(self.random.sample(WORDS, 4)))
+                for i in range(number, number + size)
+            ))
+            ids += level
+            parents, number = level or parents, number + size
+        return ids
+
+    def products(self, count, category_ids):
+        def rows():
+            for i in range(count):
+                name = f'{self.random.choice(ADJECTIVES)} {self.random.choice(NOUNS)} {i}'
+                yield Product(
+                    name=name,
+                    slug=slugify(name),
+                    category_id=self.random.choice(category_ids),
+                    description=' '.join(self.random.choices(WORDS, k=12)),
+                    price=Decimal(self.random.randint(500, 15000)) / 100,
+                    stock=self.random.randint(100, 1000),
+                    size=self.random.choice(Product.SIZE_CHOICES)[0],
+                    type=self.random.choice(Product.TYPE_CHOICES)[0],
+                    season=self.random.choice(Product.SEASON_CHOICES)[0],
+                    color=self.random.choice(COLORS),
+                    is_active=self.random.random() > 0.05,
+                    views=self.random.randint(0, 5000),
+                )
+        return self.insert(Product, rows())
+
+    def users(self, count, password='password'):
+        # One hash for everyone, hashing per user would dominate the run
+        password = make_password(password)
+        return self.insert(User, (
+            User(username=f'user{i:06d}', email=f'user{i:06d}@example.com', password=password)
+            for i in range(count)
+        ))
+
+    def pairs(self, count, user_ids, product_ids):
+        """`count` (user_id, product_id), count/len(user_ids) distinct products per user"""
+        per_user, extra = divmod(count, max(len(user_ids), 1))
+        for index, user_id in enumerate(user_ids):
+            size = min(per_user + (index < extra), len(product_ids))
+            if not size:
+                return
+            for product_id in self.random.sample(product_ids, size):
+                yield user_id, product_id
+
+    def ratings(self, count, user_ids, product_ids):
+        return self.insert(Rating, (
+            Rating(product_id=product_id, user_id=user_id,
+                   rating=self.random.choices([1, 2, 3, 4, 5], weights=[1, 1, 3, 5, 6])[0])
+            for user_id, product_id in self.pairs(count, user_ids, product_ids)
+        ))
+
+    def profiles(self, user_ids):
+        return self.insert(UserProfile, (
+            UserProfile(user_id=user_id, phone=f'69{self.random.randint(0, 10 ** 8 - 1):08d}',
+                        address=f'{self.random.choice(STREETS)} {self.random.randint(1, 200)}',
+                        city=self.random.choice(CITIES), postal_code=f'{self.random.randint(10000, 85999)}')
+            for user_id in user_ids
+        ))
+
+    def carts(self, user_ids, product_ids, max_items=3):
+        """A cart per user, with up to max_items lines"""
+        cart_ids = self.insert(Cart, (Cart(user_id=user_id) for user_id in user_ids))
+        self.insert(CartItem, (
+            CartItem(cart_id=cart_id, product_id=product_id, quantity=self.random.randint(1, 3))
+            for cart_id in cart_ids
+            for product_id in self.random.sample(product_ids, min(self.random.randint(0, max_items),
+                                                                  len(product_ids)))
+        ))
+        return cart_ids
+
+    def wishlists(self, count, user_ids, product_ids):
+        return self.insert(Wishlist, (
+            Wishlist(user_id=user_id, product_id=product_id)
+            for user_id, product_id in self.pairs(count, user_ids, product_ids)
+        ))
+
+    def view_history(self, count, user_ids, product_ids, days=90):
+        now = timezone.now()
+        return self.insert(ViewHistory, (
+            ViewHistory(user_id=user_id, product_id=product_id,
+                        viewed_at=now - timedelta(seconds=self.random.randint(0, days * 86400)))
+            for user_id, product_id in self.pairs(count, user_ids, product_ids)
+        ))
+
+    def orders(self, count, user_ids, product_ids, days=365, max_items=4):
+        """Orders of 1..max_items lines spread over the last `days` days"""
+        # Every price at once, an id__in over the whole catalog would hit SQLite's variable limit
+        prices = dict(Product.objects.values_list('id', 'price').iterator(chunk_size=self.batch_size))
+        statuses = [status for status, _ in Order.STATUS_CHOICES]
+        now = timezone.now()
+        order_ids, items = [], 0
+        for numbers in batched(range(count), self.batch_size):
+            lines = [
+                [(product_id, self.random.randint(1, 3))
+                 for product_id in self.random.sample(product_ids, min(self.random.randint(1, max_items),
+                                                                       len(product_ids)))]
+                for _ in numbers
+            ]
+            orders = Order.objects.bulk_create([
+                Order(user_id=self.random.choice(user_ids), status=self.random.choice(statuses),
+                      shipping_address=f'{self.random.choice(STREETS)} {self.random.randint(1, 200)}',
+                      total=sum(prices[product_id] * quantity for product_id, quantity in order_lines))
+                for order_lines in lines
+            ])
+            # created_at is auto_now_add, spread it afterwards
+            for order in orders:
+                order.created_at = now - timedelta(seconds=self.random.randint(0, days * 86400))
+            Order.objects.bulk_update(orders, ['created_at'])
+            items += len(OrderItem.objects.bulk_create([
+                OrderItem(order_id=order.pk, product_id=product_id, quantity=quantity, price=prices[product_id])
+                for order, order_lines in zip(orders, lines)
+                for product_id, quantity in order_lines
+            ]))
+            order_ids += [order.pk for order in orders]
+        self.log(f'Order: {len(order_ids)} rows, OrderItem: {items} rows')
+        return order_ids
+
+    def finish(self):
+        """Rebuild what the signals would have maintained"""
+        self.log('Rebuilding rating aggregates...')
+        Product.objects.rebuild_rating_aggregates()
+        self.log('Rebuilding search index...')
+        get_search_backend().rebuild()
+        bump_catalog_version()
+
+    def catalog(self, products, ratings, users, categories=20):
+        """Categories, products, users and their ratings"""
+        category_ids = self.categories(categories)
+        product_ids = self.products(products, category_ids)
+        user_ids = self.users(users)
+        self.ratings(ratings, user_ids, product_ids)
+        self.finish()
+        return product_ids, user_ids
+
+    def everything(self, categories=30, depth=2, products=100000, users=10000, ratings=400000,
+                   wishlists=100000, views=300000, orders=100000):
+        """A whole shop: catalog, customers and their activity"""
+        category_ids = self.categories(categories, depth)
+        product_ids = self.products(products, category_ids)
+        user_ids = self.users(users)
+        self.profiles(user_ids)
+        self.carts(user_ids, product_ids)
+        self.ratings(ratings, user_ids, product_ids)
+        self.wishlists(wishlists, user_ids, product_ids)
+        self.view_history(views, user_ids, product_ids)
+        self.orders(orders, user_ids, product_ids)
+        self.finish()
+        return product_ids, user_ids
@@ -0,0 +1,49 @@
+from django import template
+
+from shop.fragments import card_key, get_cache, get_timeout, prime_cards
+
+register = template.Library()
+
+
+class CardCacheNode(template.Node):
+    def __init__(self, nodelist, name, product):
+        self.nodelist = nodelist
+        self.name = name
+        self.product = product
+
+    def render(self, context):
+        product = self.product.resolve(context)
+        cache = get_cache()
+        key = card_key(self.name.resolve(context), product)
+        primed = getattr(product, '_primed_cards', {})
+        html = primed[key] if key in primed else cache.get(key)
+        if html is None:
+            html = self.nodelist.render(context)
+            cache.set(key, html, get_timeout())
+        return html
+
+
+@register.tag
+def cardcache(parser, token):
+    """
+    Cache a product card until the product or its ratings change:
+
+        {% cardcache "list" product %} ... {% endcardcache %}
+    """
+    bits = token.split_contents()
+    if len(bits) != 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires a fragment name and a product")
+    nodelist = parser.parse(('endcardcache',))
+    parser.delete_first_token()
+    return CardCacheNode(nodelist, parser.compile_filter(bits[1]), parser.compile_filter(bits[2]))
+
+
+@register.simple_tag
+def primecards(name, *product_lists):
+    """
+    Fetch the cards of the products that follow in two cache round trips:
+
+        {% primecards "list" page_obj %}
+    """
+    prime_cards(name, [product for products in product_lists for product in products])
+    return ''
@@ -1,3 +1,1269 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.db import OperationalError, connection
+from django.http import HttpResponse, QueryDict
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.urls import resolve, reverse
+from django.utils import timezone
+from .benchmark import SCENARIOS, Benchmark
+from .catalog import filter_products
+from .catalog_sync import CatalogImporter, export_rows, read_rows, write_rows
+from .counters import view_counter, view_history
+from .facets import compute_facets, get_facets
+from .management.commands import sqlite_load_test
+from .fragments import get_cache
+from .metrics import request_metrics
+from .middleware import PIN_COOKIE, PrimaryPinningMiddleware
+from .models import (Cart, CartItem, Category, CategorySales, DailySales, Order, OrderItem, Product, ProductNeighbor,
+                     ProductRanking, ProductSales, Rating, SalesReportState, UserProfile, ViewHistory, Wishlist)
+from .orders import OutOfStock, place_order
+from .rankings import RESCALE_AFTER, bestsellers, get_state, trending_products, update_rankings
+from .recommendations import build_neighbors, similar_products
+from .reports import EXPORT_FIELDS, refresh_sales
+from .routers import PrimaryReplicaRouter, use_primary
+from .search import PostgresSearchBackend, get_search_backend, tokenize
+from .synthetic import SyntheticData
+
+
+def tearDownModule():
+    # Buffered views belong to the test database, never flush them at exit
+    view_counter.clear()
+    view_history.clear()
+
+
+def make_product(category, name='Home Jersey', **kwargs):
+    kwargs.setdefault('description', 'Official jersey')
+    kwargs.setdefault('price', 79.99)
+    kwargs.setdefault('stock', 10)
+    return Product.objects.create(name=name, category=category, **kwargs)
+
+
+class RatingAggregatesTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Clothes')
+        self.product = make_product(self.category)
+        self.user = User.objects.create_user('fan', password='pass12345')
+        self.other = User.objects.create_user('fan2', password='pass12345')
+
+    def test_create_update_and_delete_keep_aggregates(self):
+        Rating.objects.create(product=self.product, user=self.user, rating=4)
+        Rating.objects.create(product=self.product, user=self.other, rating=2)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_count, self.product.rating_sum), (2, 6))
+        self.assertEqual(self.product.average_rating(), 3)
+
+        rating = Rating.objects.get(user=self.user)
+        rating.rating = 5
+        rating.save()
+        rating.delete()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_count, self.product.rating_sum), (1, 2))
+
+    def test_add_rating_view_updates_aggregates(self):
+        self.client.login(username='fan', password='pass12345')
+        url = reverse('add_rating', args=[self.product.id])
+        self.client.post(url, {'rating': 3})
+        response = self.client.post(url, {'rating': 5})
+        self.assertEqual(response.json()['avg_rating'], 5)
+        self.assertEqual(response.json()['rating_count'], 1)
+
+    def test_rebuild_command(self):
+        Rating.objects.create(product=self.product, user=self.user, rating=4)
+        Product.objects.update(rating_count=0, rating_sum=0)
+        call_command('rebuild_rating_aggregates', stdout=StringIO())
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_count, self.product.rating_sum), (1, 4))
+
+
+class CatalogQueryBudgetTests(TestCase):
+    # count + categories + one page of products + facets (on a cache miss)
+    QUERY_BUDGET = 4
+
+    def setUp(self):
+        cache.clear()
+        self.categories = [Category.objects.create(name=f'Category {i}') for i in range(3)]
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_product_list_query_count_is_independent_of_page_size(self):
+        make_product(self.categories[0], name='Scarf')
+        small_page = self.count_queries(reverse('product_list'))
+
+        for i in range(30):
+            make_product(self.categories[i % 3], name=f'Jersey {i}')
+        full_page = self.count_queries(reverse('product_list'))
+        filtered_page = self.count_queries(reverse('product_list') + '?sort_by=price_asc&page=2')
+
+        self.assertEqual(small_page, full_page)
+        self.assertEqual(full_page, filtered_page)
+        self.assertLessEqual(full_page, self.QUERY_BUDGET)
+
+    def test_catalog_annotates_avg_rating(self):
+        product = make_product(self.categories[0])
+        Product.objects.filter(pk=product.pk).update(rating_count=2, rating_sum=7)
+        self.assertEqual(Product.objects.catalog().get(pk=product.pk).avg_rating, 3.5)
+        unrated = make_product(self.categories[0], name='Hat')
+        self.assertEqual(Product.objects.catalog().get(pk=unrated.pk).avg_rating, 0)
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Clothes')
+
+    def search(self, query):
+        products = get_search_backend().search(Product.objects.catalog(), query)
+        return list(products.order_by('-search_rank').values_list('name', flat=True))
+
+    def test_greek_accents_are_folded(self):
+        make_product(self.category, name='Παναθηναϊκός Scarf')
+        self.assertEqual(self.search('Παναθηναικος'), ['Παναθηναϊκός Scarf'])
+        self.assertEqual(self.search('ΠΑΝΑΘΗΝΑΪΚΟΣ'), ['Παναθηναϊκός Scarf'])
+
+    def test_postgres_document_is_normalized_like_the_query(self):
+        backend = PostgresSearchBackend()
+        product = make_product(self.category, name='Παναθηναϊκός Scarf')
+        _, config, name, *_ = backend._params(backend._row(product))
+        self.assertEqual(config, 'simple')
+        self.assertEqual(name.split(), tokenize('ΠΑΝΑΘΗΝΑΪΚΟΣ scarf'))
+
+    def test_name_matches_rank_above_description_matches(self):
+        make_product(self.category, name='Training Shirt', description='Worn with the retro jersey')
+        make_product(self.category, name='Retro Jersey', description='Classic shirt')
+        self.assertEqual(self.search('retro'), ['Retro Jersey', 'Training Shirt'])
+        self.assertEqual(self.search('jer'), ['Retro Jersey', 'Training Shirt'])
+
+    def test_index_follows_save_and_delete(self):
+        product = make_product(self.category, name='Beanie')
+        product.name = 'Winter Hat'
+        product.save()
+        self.assertEqual(self.search('beanie'), [])
+        self.assertEqual(self.search('hat'), ['Winter Hat'])
+        product.delete()
+        self.assertEqual(self.search('hat'), [])
+
+    def test_product_list_search(self):
+        make_product(self.category, name='Παναθηναϊκός Hoodie')
+        make_product(self.category, name='Football')
+        response = self.client.get(reverse('product_list'), {'search': 'παναθηναικος'})
+        self.assertEqual([p.name for p in response.context['page_obj']], ['Παναθηναϊκός Hoodie'])
+
+    def test_every_match_reaches_the_filters(self):
+        other = Category.objects.create(name='Accessories')
+        Product.objects.bulk_create([
+            Product(name=f'Jersey {i}', slug=f'jersey-{i}', category=self.category, description='', price=10)
+            for i in range(600)
+        ])
+        make_product(other, name='Jersey Mug')
+        get_search_backend().rebuild()
+
+        products, _, _ = filter_products(QueryDict(f'search=jersey&category={other.id}'))
+        self.assertEqual([p.name for p in products], ['Jersey Mug'])
+        products, _, _ = filter_products(QueryDict('search=jersey'))
+        self.assertEqual(products.count(), 601)
+
+
+class ViewCounterBufferTests(TestCase):
+    def setUp(self):
+        self.product = make_product(Category.objects.create(name='Clothes'))
+        view_counter.clear()
+
+    def tearDown(self):
+        view_counter.clear()
+
+    def test_views_are_buffered_until_flush(self):
+        for _ in range(3):
+            self.client.get(reverse('product_detail', args=[self.product.slug]))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.views, 0)
+        self.assertEqual(view_counter.pending(self.product.id), 3)
+
+        other = make_product(self.product.category, name='Scarf')
+        view_counter.add(other.id, 2)
+        with self.assertNumQueries(1):
+            view_counter.flush()
+        self.assertEqual(Product.objects.get(pk=self.product.pk).views, 3)
+        self.assertEqual(Product.objects.get(pk=other.pk).views, 2)
+        self.assertEqual(len(view_counter), 0)
+
+    @override_settings(SHOP_VIEW_COUNTER={'THRESHOLD': 2, 'INTERVAL': 3600})
+    def test_threshold_triggers_flush(self):
+        view_counter.add(self.product.id)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).views, 0)
+        view_counter.add(self.product.id)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).views, 2)
+
+    @override_settings(SHOP_VIEW_COUNTER={'THRESHOLD': 1, 'INTERVAL': 3600})
+    def test_failed_automatic_flush_keeps_the_batch(self):
+        locked = mock.patch.object(view_counter, 'write', side_effect=OperationalError('database is locked'))
+        with locked, self.assertLogs('shop.counters', 'ERROR'):
+            response = self.client.get(reverse('product_detail', args=[self.product.slug]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(view_counter.pending(self.product.id), 1)
+
+        with locked, self.assertRaises(OperationalError), self.assertLogs('shop.counters', 'ERROR'):
+            view_counter.flush()
+        view_counter.flush()
+        self.assertEqual(Product.objects.get(pk=self.product.pk).views, 1)
+
+
+class ViewHistoryIngestionTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Clothes')
+        self.product = make_product(self.category)
+        self.user = User.objects.create_user('fan', password='pass12345')
+        view_history.clear()
+
+    def tearDown(self):
+        view_history.clear()
+        view_counter.clear()
+
+    def test_views_are_queued_and_upserted(self):
+        self.client.login(username='fan', password='pass12345')
+        url = reverse('product_detail', args=[self.product.slug])
+        self.client.get(url)
+        self.assertFalse(ViewHistory.objects.exists())
+
+        view_history.flush()
+        first_view = ViewHistory.objects.get(user=self.user, product=self.product).viewed_at
+
+        self.client.get(url)
+        view_history.flush()
+        self.assertEqual(ViewHistory.objects.count(), 1)
+        self.assertGreater(ViewHistory.objects.get().viewed_at, first_view)
+
+    def test_batch_flush_is_bulk(self):
+        other = make_product(self.category, name='Scarf')
+        view_history.add(self.user.id, self.product.id)
+        view_history.add(self.user.id, other.id)
+        view_history.add(self.user.id, self.product.id)
+        with self.assertNumQueries(3):  # the users and products that still exist, the upsert
+            self.assertEqual(view_history.flush(), 2)
+
+    def test_views_of_deleted_rows_are_dropped(self):
+        other = make_product(self.category, name='Scarf')
+        rival = User.objects.create_user('rival')
+        view_history.add(self.user.id, self.product.id)
+        view_history.add(self.user.id, other.id)
+        view_history.add(rival.id, self.product.id)
+        other.delete()
+        rival.delete()
+
+        self.assertEqual(view_history.flush(), 1)
+        self.assertEqual(len(view_history), 0)
+        self.assertEqual(list(ViewHistory.objects.values_list('user', 'product')), [(self.user.id, self.product.id)])
+
+    def test_prune_view_history(self):
+        other = make_product(self.category, name='Scarf')
+        ViewHistory.objects.create(user=self.user, product=self.product,
+                                   viewed_at=timezone.now() - timedelta(days=40))
+        ViewHistory.objects.create(user=self.user, product=other)
+        call_command('prune_view_history', days=30, batch_size=1, stdout=StringIO())
+        self.assertEqual(list(ViewHistory.objects.values_list('product', flat=True)), [other.id])
+
+
+class ProductCardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Clothes')
+        self.product = make_product(self.category, name='Home Jersey')
+        self.user = User.objects.create_user('fan', password='pass12345')
+
+    def render_list(self):
+        return self.client.get(reverse('product_list')).content.decode()
+
+    def test_cards_are_served_from_cache(self):
+        self.assertIn('Home Jersey', self.render_list())
+        # Bypasses signals and keeps updated_at, so the cached card is served
+        Product.objects.filter(pk=self.product.pk).update(description='Changed behind the cache')
+        self.assertNotIn('Changed behind the cache', self.render_list())
+
+    def test_product_save_invalidates_card(self):
+        self.render_list()
+        self.product.description = 'Now with sponsor logo'
+        self.product.save()
+        self.assertIn('Now with sponsor logo', self.render_list())
+
+    def test_rating_invalidates_card(self):
+        self.assertEqual(self.render_list().count('fas fa-star'), 0)
+        Rating.objects.create(product=self.product, user=self.user, rating=5)
+        self.assertEqual(self.render_list().count('fas fa-star'), 5)
+
+    def test_cards_of_a_page_cost_two_round_trips(self):
+        for i in range(5):
+            make_product(self.category, name=f'Scarf {i}')
+        self.render_list()
+
+        # Round trips, not the get() calls locmem's get_many() makes internally
+        calls, depth = [], []
+        card_cache = get_cache()
+        for method in ('get', 'get_many'):
+            original = getattr(card_cache, method)
+
+            def record(keys, *args, method=method, original=original, **kwargs):
+                if not depth:
+                    calls.append((method, keys))
+                depth.append(method)
+                try:
+                    return original(keys, *args, **kwargs)
+                finally:
+                    depth.pop()
+            self.addCleanup(setattr, card_cache, method, original)
+            setattr(card_cache, method, record)
+
+        for url in (reverse('product_list'), reverse('home')):
+            calls.clear()
+            self.assertIn('Scarf 4', self.client.get(url).content.decode())
+            card_calls = [method for method, keys in calls if 'shop:card' in str(keys)]
+            self.assertEqual(card_calls, ['get_many', 'get_many'], url)
+
+    def test_category_rename_invalidates_card(self):
+        self.render_list()
+        self.category.name = 'Jerseys'
+        self.category.save()
+        self.assertIn('<i class="fas fa-tag me-1"></i>Jerseys', self.render_list())
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Clothes')
+        # Repeated prices and names exercise the id tie-breaker
+        for i in range(30):
+            make_product(category, name=f'Jersey {i % 7}', slug=f'jersey-{i}', price=10 + i % 4)
+
+    def walk(self, sort_by):
+        pks, query = [], f'pagination=cursor&sort_by={sort_by}'
+        while query:
+            response = self.client.get(reverse('product_list') + '?' + query)
+            page = response.context['page_obj']
+            pks.extend(p.pk for p in page)
+            query = page.next_query if page.has_next() else None
+        return pks, response
+
+    def test_cursor_pages_match_offset_ordering(self):
+        for sort_by in ['price_asc', 'price_desc', 'name_asc', 'name_desc', 'newest', '']:
+            offset = self.client.get(reverse('product_list'), {'sort_by': sort_by})
+            expected = list(offset.context['page_obj'].paginator.object_list.values_list('pk', flat=True))
+            pks, last = self.walk(sort_by)
+            self.assertEqual(len(expected), 30)
+            if sort_by in ('price_asc', 'price_desc', 'name_asc', 'name_desc'):
+                # The offset listing has no tie-breaker, compare as sets there
+                self.assertCountEqual(pks, expected)
+            else:
+                self.assertEqual(pks, expected)
+
+            previous = self.client.get(reverse('product_list') + '?' + last.context['page_obj'].previous_query)
+            self.assertEqual([p.pk for p in previous.context['page_obj']], pks[12:24])
+
+    def test_cursor_mode_skips_count(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('product_list'), {'pagination': 'cursor', 'sort_by': 'price_asc'})
+        self.assertFalse(any('COUNT(*)' in q['sql'] for q in ctx.captured_queries))
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        response = self.client.get(reverse('product_list'), {'pagination': 'cursor', 'cursor': 'garbage'})
+        self.assertEqual(len(response.context['page_obj']), 12)
+        self.assertFalse(response.context['page_obj'].has_previous())
+
+
+class CatalogApiTests(TestCase):
+    def setUp(self):
+        self.clothes = Category.objects.create(name='Clothes')
+        self.accessories = Category.objects.create(name='Accessories')
+        self.jersey = make_product(self.clothes, name='Home Jersey', size='L', price=79.99)
+        self.scarf = make_product(self.accessories, name='Scarf', size='ONE', price=19.99)
+
+    def test_products_reuse_catalog_filters(self):
+        response = self.client.get(reverse('api_products'), {'category': self.clothes.id})
+        data = response.json()
+        self.assertEqual(data['count'], 1)
+        self.assertEqual(data['results'][0]['slug'], self.jersey.slug)
+        self.assertEqual(data['results'][0]['category']['name'], 'Clothes')
+
+        response = self.client.get(reverse('api_products'), {'sort_by': 'price_asc', 'pagination': 'cursor'})
+        self.assertEqual([p['name'] for p in response.json()['results']], ['Scarf', 'Home Jersey'])
+
+    def test_conditional_get_returns_304_until_catalog_changes(self):
+        url = reverse('api_products')
+        etag = self.client.get(url)['ETag']
+        self.assertFalse(etag.startswith('W/'))
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertNotEqual(self.client.get(url, {'size': 'L'})['ETag'], etag)
+
+        self.scarf.price = 24.99
+        self.scarf.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_product_detail_and_categories_etags(self):
+        url = reverse('api_product_detail', args=[self.jersey.slug])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Rating.objects.create(product=self.jersey, user=User.objects.create_user('fan'), rating=4)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.json()['avg_rating'], 4)
+
+        self.assertEqual(self.client.get(reverse('api_product_detail', args=['missing'])).status_code, 404)
+
+        url = reverse('api_categories')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_facets(self):
+        data = self.client.get(reverse('api_facets'), {'size': 'L'}).json()
+        self.assertEqual({o['value']: o['count'] for o in data['size']}['ONE'], 1)
+        self.assertEqual({o['label']: o['count'] for o in data['category']}, {'Accessories': 0, 'Clothes': 1})
+
+
+class FacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.clothes = Category.objects.create(name='Clothes')
+        self.accessories = Category.objects.create(name='Accessories')
+        make_product(self.clothes, name='Home Jersey', size='L', type='MEN', price=79.99)
+        make_product(self.clothes, name='Kids Jersey', size='S', type='KIDS', price=39.99)
+        make_product(self.clothes, name='Women Jersey', size='M', type='WOMEN', price=74.99)
+        make_product(self.accessories, name='Scarf', size='ONE', price=19.99)
+
+    def counts(self, facets, dimension):
+        return {option['value']: option['count'] for option in facets[dimension] if option['count']}
+
+    def test_each_dimension_ignores_its_own_filter(self):
+        params = QueryDict(f'category={self.clothes.id}&size=L')
+        facets = compute_facets(params)
+        self.assertEqual(self.counts(facets, 'size'), {'L': 1, 'S': 1, 'M': 1})
+        self.assertEqual(self.counts(facets, 'category'), {str(self.clothes.id): 1})
+        self.assertEqual(self.counts(facets, 'type'), {'MEN': 1})
+        self.assertEqual(self.counts(facets, 'price'), {'75-': 1})
+
+    def test_price_links_keep_the_other_filters(self):
+        params = QueryDict(f'search=jersey&category={self.clothes.id}&min_price=70&page=2&sort_by=price_asc')
+        facets = get_facets(params)
+        links = [QueryDict(option['query']) for option in facets['price']]
+        self.assertEqual(links[1].dict(), {'search': 'jersey', 'category': str(self.clothes.id),
+                                           'sort_by': 'price_asc', 'min_price': '25', 'max_price': '49.99'})
+        self.assertNotIn('max_price', links[3])
+
+        # The count next to a bucket is what its link shows
+        response = self.client.get(reverse('product_list') + '?' + facets['price'][1]['query'])
+        self.assertEqual([p.name for p in response.context['page_obj']], ['Kids Jersey'])
+        self.assertEqual(facets['price'][1]['count'], 1)
+
+    def test_non_numeric_prices_are_ignored(self):
+        for value in ('inf', '-Infinity', 'nan', 'snan', 'abc'):
+            response = self.client.get(reverse('product_list'), {'min_price': value, 'max_price': '50'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(sorted(p.name for p in response.context['page_obj']), ['Kids Jersey', 'Scarf'])
+
+    def test_all_dimensions_in_one_query_and_cached(self):
+        params = QueryDict('type=KIDS&search=jersey')
+        categories = list(Category.objects.all())
+        with self.assertNumQueries(1):  # the search index is a subquery of the facet aggregate
+            facets = get_facets(params, categories)
+        # The scarf matches 'jersey' through its description
+        self.assertEqual(self.counts(facets, 'type'), {'MEN': 1, 'KIDS': 1, 'WOMEN': 1, 'UNISEX': 1})
+        with self.assertNumQueries(0):
+            cached = get_facets(QueryDict('search=jersey&type=KIDS&page=2'), categories)
+        self.assertEqual({dimension: facets[dimension] for dimension in ('category', 'size', 'type', 'season')},
+                         {dimension: cached[dimension] for dimension in ('category', 'size', 'type', 'season')})
+
+        make_product(self.accessories, name='Hat', type='KIDS')
+        self.assertNotEqual(get_facets(QueryDict('search=jersey&type=KIDS'), categories)['type'], facets['type'])
+
+    def test_product_list_shows_counts(self):
+        content = self.client.get(reverse('product_list'), {'size': 'L'}).content.decode()
+        self.assertIn('Clothes (1)', content)
+        self.assertIn('€0 - €25 (0)', content)
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Clothes')
+        self.jersey = make_product(category, name='Home Jersey', price=80, stock=3)
+        self.scarf = make_product(category, name='Scarf', price=20, stock=1)
+        self.user = User.objects.create_user('fan', password='pass12345')
+        UserProfile.objects.create(user=self.user, address='Leoforos Alexandras 160', city='Athens')
+        self.cart = Cart.objects.create(user=self.user)
+
+    def test_checkout_creates_order_and_reserves_stock(self):
+        CartItem.objects.create(cart=self.cart, product=self.jersey, quantity=2)
+        CartItem.objects.create(cart=self.cart, product=self.scarf, quantity=1)
+        self.client.login(username='fan', password='pass12345')
+        response = self.client.post(reverse('checkout'))
+        self.assertRedirects(response, reverse('dashboard'))
+
+        order = Order.objects.get(user=self.user)
+        self.assertEqual(order.total, 180)
+        self.assertEqual(order.shipping_address, 'Leoforos Alexandras 160, Athens')
+        self.assertEqual(order.items.count(), 2)
+        self.assertEqual(Product.objects.get(pk=self.jersey.pk).stock, 1)
+        self.assertEqual(Product.objects.get(pk=self.scarf.pk).stock, 0)
+        self.assertFalse(self.cart.items.exists())
+
+    def test_out_of_stock_rolls_back_everything(self):
+        CartItem.objects.create(cart=self.cart, product=self.jersey, quantity=2)
+        CartItem.objects.create(cart=self.cart, product=self.scarf, quantity=2)
+        with self.assertRaises(OutOfStock) as ctx:
+            place_order(self.user, self.cart, '')
+        self.assertEqual(ctx.exception.products, [self.scarf])
+        self.assertEqual(Product.objects.get(pk=self.jersey.pk).stock, 3)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.cart.items.count(), 2)
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    def test_concurrent_checkouts_cannot_oversell(self):
+        category = Category.objects.create(name='Clothes')
+        product = make_product(category, name='Last Jersey', stock=1)
+        carts = []
+        for i in range(2):
+            user = User.objects.create_user(f'fan{i}')
+            cart = Cart.objects.create(user=user)
+            CartItem.objects.create(cart=cart, product=product, quantity=1)
+            carts.append((user, cart))
+
+        barrier = threading.Barrier(len(carts))
+        outcomes = []
+
+        def checkout(user, cart):
+            barrier.wait()
+            try:
+                # The in-memory test database reports lock conflicts instead of
+                # waiting for them, retry like a client would
+                for _ in range(50):
+                    try:
+                        place_order(user, cart, '')
+                        outcomes.append('ordered')
+                        return
+                    except OutOfStock:
+                        outcomes.append('out of stock')
+                        return
+                    except OperationalError:
+                        time.sleep(0.01)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout, args=args) for args in carts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertCountEqual(outcomes, ['ordered', 'out of stock'])
+        self.assertEqual(Product.objects.get(pk=product.pk).stock, 0)
+        self.assertEqual(OrderItem.objects.filter(product=product).count(), 1)
+
+
+class CartSummaryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Clothes')
+        self.jersey = make_product(category, name='Home Jersey', price=79.99)
+        self.scarf = make_product(category, name='Scarf', price=19.99)
+        self.user = User.objects.create_user('fan', password='pass12345')
+        self.cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=self.cart, product=self.jersey, quantity=2)
+        self.client.login(username='fan', password='pass12345')
+
+    def test_totals_are_computed_in_sql(self):
+        CartItem.objects.create(cart=self.cart, product=self.scarf, quantity=1)
+        with self.assertNumQueries(1):
+            summary = self.cart.aggregate_items()
+        self.assertEqual(summary, {'count': 3, 'total': Decimal('179.97')})
+        self.assertEqual(Cart.objects.create(user=self.user).get_total(), 0)
+
+    def test_cart_page_loads_items_once(self):
+        for i in range(5):
+            CartItem.objects.create(cart=self.cart, product=make_product(self.jersey.category, name=f'Hat {i}'))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('cart'))
+        item_queries = [q for q in ctx.captured_queries if 'shop_cartitem' in q['sql']]
+        self.assertEqual(len(item_queries), 1)
+        self.assertEqual(response.context['summary']['count'], 7)
+
+    def test_mutations_invalidate_cached_summary(self):
+        self.assertEqual(self.cart.get_summary()['count'], 2)
+        response = self.client.post(reverse('add_to_cart', args=[self.scarf.id]))
+        self.assertEqual(response.json()['cart_count'], 3)
+
+        item = CartItem.objects.get(product=self.jersey)
+        response = self.client.post(reverse('remove_from_cart', args=[item.id]))
+        self.assertEqual(response.json()['cart_count'], 1)
+        self.assertEqual(response.json()['cart_total'], 19.99)
+        self.assertEqual(self.client.get(reverse('cart')).context['summary']['count'], 1)
+
+
+class CartBadgeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Clothes')
+        self.product = make_product(self.category)
+        self.user = User.objects.create_user('fan', password='pass12345')
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+
+    def login(self):
+        self.client.post(reverse('login'), {'username': 'fan', 'password': 'pass12345'})
+
+    def test_login_seeds_badge(self):
+        self.login()
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, '<span class="badge rounded-pill bg-light text-dark" id="navbar-cart-count">2</span>', html=True)
+
+    def test_badge_costs_no_queries(self):
+        self.login()
+        self.client.get(reverse('home'))
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('home'))
+        self.assertFalse([q for q in ctx.captured_queries if 'shop_cart' in q['sql']])
+
+    def test_cart_views_keep_badge_in_sync(self):
+        self.login()
+        self.client.post(reverse('add_to_cart', args=[self.product.id]))
+        self.assertEqual(self.client.get(reverse('home')).context['cart_count'], 3)
+
+        item = CartItem.objects.get(product=self.product)
+        self.client.post(reverse('remove_from_cart', args=[item.id]))
+        self.assertEqual(self.client.get(reverse('home')).context['cart_count'], 0)
+
+
+class CartBatchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Clothes')
+        self.jersey = make_product(category, name='Home Jersey', price=80)
+        self.scarf = make_product(category, name='Scarf', price=20)
+        self.hat = make_product(category, name='Hat', price=25)
+        self.user = User.objects.create_user('fan', password='pass12345')
+        self.cart = Cart.objects.create(user=self.user)
+        self.jersey_item = CartItem.objects.create(cart=self.cart, product=self.jersey, quantity=1)
+        self.scarf_item = CartItem.objects.create(cart=self.cart, product=self.scarf, quantity=3)
+        self.client.login(username='fan', password='pass12345')
+
+    def tearDown(self):
+        # Product pages buffer views of rows that are rolled back
+        view_counter.clear()
+        view_history.clear()
+
+    def post(self, operations):
+        return self.client.post(reverse('cart_batch'), json.dumps({'operations': operations}),
+                                content_type='application/json')
+
+    def test_batch_applies_all_operations(self):
+        response = self.post([
+            {'op': 'add', 'product_id': self.hat.id, 'quantity': 1},
+            {'op': 'add', 'product_id': self.hat.id, 'quantity': 1},
+            {'op': 'set', 'item_id': self.jersey_item.id, 'quantity': 2},
+            {'op': 'remove', 'item_id': self.scarf_item.id},
+        ])
+        data = response.json()
+        self.assertEqual((data['cart_count'], data['cart_total']), (4, 210.0))
+        self.assertEqual(
+            dict(self.cart.items.values_list('product__name', 'quantity')),
+            {'Home Jersey': 2, 'Hat': 2},
+        )
+
+    def test_batch_writes_are_bulk(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.post([
+                {'op': 'add', 'product_id': self.hat.id},
+                {'op': 'set', 'item_id': self.jersey_item.id, 'quantity': 5},
+                {'op': 'set', 'item_id': self.scarf_item.id, 'quantity': 4},
+            ])
+        writes = [q for q in ctx.captured_queries
+                  if 'shop_cartitem' in q['sql'] and q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))]
+        self.assertEqual(len(writes), 2)
+
+    def test_invalid_batch_changes_nothing(self):
+        response = self.post([
+            {'op': 'remove', 'item_id': self.scarf_item.id},
+            {'op': 'add', 'product_id': 999999},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.cart.items.count(), 2)
+
+        self.assertEqual(self.post([{'op': 'explode', 'item_id': self.scarf_item.id}]).status_code, 400)
+        other = Cart.objects.create(user=User.objects.create_user('rival'))
+        rival_item = CartItem.objects.create(cart=other, product=self.hat)
+        self.assertEqual(self.post([{'op': 'remove', 'item_id': rival_item.id}]).status_code, 400)
+
+    def test_batch_requires_the_page_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        client.login(username='fan', password='pass12345')
+        body = json.dumps({'operations': [{'op': 'add', 'product_id': self.hat.id}]})
+        self.assertEqual(client.post(reverse('cart_batch'), body, content_type='application/json').status_code, 403)
+
+        # What base.js does: read the token from the meta tag, send it as X-CSRFToken
+        page = client.get(reverse('product_detail', args=[self.hat.slug])).content.decode()
+        token = page.split('<meta name="csrf-token" content="', 1)[1].split('"', 1)[0]
+        response = client.post(reverse('cart_batch'), body, content_type='application/json',
+                               HTTP_X_CSRFTOKEN=token)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['cart_count'], 5)
+
+
+class SessionCartTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Clothes')
+        self.jersey = make_product(category, name='Home Jersey', price=80)
+        self.scarf = make_product(category, name='Scarf', price=20)
+
+    def test_anonymous_add_creates_no_cart(self):
+        self.client.post(reverse('add_to_cart', args=[self.jersey.id]))
+        response = self.client.post(reverse('add_to_cart', args=[self.jersey.id]))
+        self.assertEqual(response.json()['cart_count'], 2)
+        self.assertFalse(Cart.objects.exists())
+
+        response = self.client.get(reverse('cart'))
+        self.assertEqual(response.context['summary']['total'], 160)
+        self.assertContains(response, 'Home Jersey')
+
+    def test_login_merges_session_cart(self):
+        user = User.objects.create_user('fan', password='pass12345')
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, product=self.jersey, quantity=1)
+        self.client.post(reverse('add_to_cart', args=[self.jersey.id]))
+        self.client.post(reverse('add_to_cart', args=[self.scarf.id]))
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(reverse('login'), {'username': 'fan', 'password': 'pass12345'})
+        writes = [q for q in ctx.captured_queries
+                  if 'shop_cartitem' in q['sql'] and q['sql'].startswith(('INSERT', 'UPDATE'))]
+        self.assertEqual(len(writes), 1)
+        self.assertEqual(dict(cart.items.values_list('product__name', 'quantity')),
+                         {'Home Jersey': 2, 'Scarf': 1})
+        self.assertEqual(self.client.session['cart_count'], 3)
+        self.assertNotIn('cart', self.client.session)
+
+    def test_register_creates_no_cart(self):
+        self.client.post(reverse('register'), {
+            'username': 'newfan', 'email': 'newfan@example.com', 'first_name': 'New', 'last_name': 'Fan',
+            'password1': 'Gate7-forever!', 'password2': 'Gate7-forever!',
+        })
+        self.assertTrue(User.objects.filter(username='newfan').exists())
+        self.assertFalse(Cart.objects.exists())
+
+
+class SessionEngineTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('fan', password='pass12345')
+
+    def session_queries(self, engine, url):
+        """django_session queries of a warm request"""
+        with override_settings(SESSION_ENGINE=f'django.contrib.sessions.backends.{engine}'):
+            # The session middleware binds its engine when the client builds its handler
+            client = Client()
+            client.force_login(self.user)
+            client.get(url)
+            with CaptureQueriesContext(connection) as ctx:
+                client.get(url)
+        return [q for q in ctx.captured_queries if 'django_session' in q['sql']]
+
+    def test_cached_db_reads_sessions_from_cache(self):
+        self.assertEqual(self.session_queries('cached_db', reverse('dashboard')), [])
+        self.assertEqual(len(self.session_queries('db', reverse('dashboard'))), 1)
+
+    def test_messages_do_not_write_the_session(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('checkout'))
+        self.assertRedirects(response, reverse('cart'), fetch_redirect_response=False)
+        self.assertIn('messages', response.cookies)
+        self.assertFalse([q for q in ctx.captured_queries
+                          if 'django_session' in q['sql'] and not q['sql'].startswith('SELECT')])
+
+    def test_benchmark_sessions_command(self):
+        make_product(Category.objects.create(name='Clothes'), name='Home Jersey')
+        out = StringIO()
+        call_command('benchmark_sessions', stdout=out)
+        self.assertIn('signed_cookies', out.getvalue())
+        self.assertFalse(User.objects.filter(username='session-benchmark').exists())
+
+
+class SQLiteTuningTests(TestCase):
+    def test_pragmas_applied_on_connect(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+
+    def test_load_test_has_no_lock_errors_when_tuned(self):
+        command = sqlite_load_test.Command()
+        call_command(command, writers=4, readers=4, operations=50, stdout=StringIO())
+        self.assertEqual(command.results['tuned'], {**command.results['tuned'], 'operations': 400, 'locked': 0})
+
+
+@override_settings(SHOP_REPLICA_DATABASE='replica')
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+
+    def test_reads_go_to_the_primary_unless_unpinned(self):
+        # Commands and jobs read the rows they update from the primary
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+        self.assertEqual(self.router.db_for_write(Product), 'default')
+        with use_primary(False):
+            self.assertEqual(self.router.db_for_read(Product), 'replica')
+            # Logins and sessions never read stale rows
+            self.assertEqual(self.router.db_for_read(User), 'default')
+            with override_settings(SHOP_REPLICA_DATABASE=None):
+                self.assertEqual(self.router.db_for_read(Product), 'default')
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+
+    def test_replica_is_never_migrated(self):
+        self.assertIs(self.router.allow_migrate('replica', 'shop'), False)
+        self.assertIsNone(self.router.allow_migrate('default', 'shop'))
+
+    def route(self, method, path, pinned=False):
+        """(database Product reads go to, response) of a request through the middleware"""
+        routed = []
+
+        def get_response(request):
+            # What the handler does between the middleware and the view
+            request.resolver_match = resolve(request.path_info)
+            middleware.process_view(request, request.resolver_match.func, (), {})
+            routed.append(self.router.db_for_read(Product))
+            return HttpResponse()
+
+        middleware = PrimaryPinningMiddleware(get_response)
+        request = getattr(RequestFactory(), method)(path)
+        if pinned:
+            request.COOKIES[PIN_COOKIE] = '1'
+        response = middleware(request)
+        return routed[0], response
+
+    def test_only_catalog_views_read_the_replica(self):
+        self.assertEqual(self.route('get', reverse('product_list'))[0], 'replica')
+        self.assertEqual(self.route('get', reverse('api_products'))[0], 'replica')
+        # A streamed response is consumed after the middleware, on the primary
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+        self.assertEqual(self.route('get', reverse('admin:shop_product_changelist'))[0], 'replica')
+        for name in ('cart', 'checkout', 'dashboard', 'staff_sales'):
+            self.assertEqual(self.route('get', reverse(name))[0], 'default', name)
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        database, response = self.route('post', reverse('cart_batch'))
+        self.assertEqual(database, 'default')
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 5)
+
+        # Inside the sticky window the cookie is sent back
+        self.assertEqual(self.route('get', reverse('product_list'), pinned=True)[0], 'default')
+        self.assertEqual(self.route('get', reverse('product_list'))[0], 'replica')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite syntax')
+class QueryPlanTests(TestCase):
+    """The hot querysets of views.py must be answered from an index"""
+
+    def plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[3] for row in cursor.fetchall()]
+
+    def assertNoFullScan(self, queryset, sorted_by_index=True):
+        plan = self.plan(queryset)
+        self.assertFalse([step for step in plan if step.startswith('SCAN') and 'USING' not in step], plan)
+        if sorted_by_index:
+            self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+
+    def test_catalog_queries(self):
+        self.assertNoFullScan(Product.objects.catalog().order_by('-created_at')[:8])
+        self.assertNoFullScan(filter_products(QueryDict(''))[0][:12])
+        self.assertNoFullScan(filter_products(QueryDict('min_price=10&max_price=50'))[0][:12])
+        self.assertNoFullScan(filter_products(QueryDict('category=1&min_price=10&sort_by=price_asc'))[0][:12])
+        self.assertNoFullScan(Product.objects.filter(is_active=True).order_by())
+        # Similar products sort the few rows of one category
+        self.assertNoFullScan(Product.objects.catalog().filter(category_id=1).exclude(id=1)[:4],
+                              sorted_by_index=False)
+        self.assertNoFullScan(Product.objects.catalog()
+                              .filter(neighbor_of__product_id=1, neighbor_of__rank__lt=4)
+                              .order_by('neighbor_of__rank'))
+        self.assertNoFullScan(trending_products())
+        self.assertNoFullScan(bestsellers())
+
+    def test_product_and_dashboard_queries(self):
+        self.assertNoFullScan(Rating.objects.filter(product_id=1).order_by('-created_at'))
+        self.assertNoFullScan(Rating.objects.filter(user_id=1).select_related('product')[:10])
+        self.assertNoFullScan(Order.objects.filter(user_id=1)[:5])
+        self.assertNoFullScan(Wishlist.objects.filter(user_id=1).select_related('product')[:10])
+        self.assertNoFullScan(ViewHistory.objects.filter(user_id=1).select_related('product')[:10])
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        request_metrics.clear()
+        category = Category.objects.create(name='Clothes')
+        self.product = make_product(category, name='Home Jersey')
+
+    def test_server_timing_and_log_line(self):
+        with self.assertLogs('shop.requests', 'INFO') as logs, \
+                CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('product_list'))
+        timing = response['Server-Timing']
+        self.assertIn(f'desc="{len(ctx.captured_queries)} queries"', timing)
+        self.assertIn('view=product_list status=200', logs.output[0])
+        self.assertEqual(logs.records[0].metrics['queries'], len(ctx.captured_queries))
+        self.assertGreater(logs.records[0].metrics['template_ms'], 0)
+
+    def test_staff_endpoint_dumps_windows(self):
+        for _ in range(3):
+            self.client.get(reverse('product_detail', args=[self.product.slug]))
+
+        User.objects.create_user('fan', password='pass12345')
+        self.client.login(username='fan', password='pass12345')
+        self.assertEqual(self.client.get(reverse('staff_metrics')).status_code, 302)
+
+        User.objects.create_user('staff', password='pass12345', is_staff=True)
+        self.client.login(username='staff', password='pass12345')
+        data = self.client.get(reverse('staff_metrics')).json()
+        detail = data['product_detail']
+        self.assertEqual(detail['count'], 3)
+        self.assertEqual(sum(detail['latency_histogram'].values()), 3)
+        self.assertGreater(detail['queries']['p50'], 0)
+
+
+class BenchmarkTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        # The scenarios buffer views of rows that are rolled back
+        view_counter.clear()
+        view_history.clear()
+
+    def test_synthetic_catalog_is_deterministic(self):
+        SyntheticData(seed=7).catalog(products=40, ratings=200, users=10, categories=3)
+        first = list(Product.objects.order_by('slug').values_list('slug', 'price', 'category__slug', 'rating_sum'))
+        self.assertEqual(Rating.objects.count(), 200)
+        self.assertEqual(sum(row[3] for row in first), sum(Rating.objects.values_list('rating', flat=True)))
+
+        Category.objects.all().delete()
+        User.objects.all().delete()
+        SyntheticData(seed=7).catalog(products=40, ratings=200, users=10, categories=3)
+        self.assertEqual(
+            list(Product.objects.order_by('slug').values_list('slug', 'price', 'category__slug', 'rating_sum')),
+            first,
+        )
+
+    def test_generate_fake_data(self):
+        options = dict(seed=3, categories=9, category_depth=2, products=40, users=6, ratings=50,
+                       wishlists=20, views=30, orders=15, stdout=StringIO())
+        call_command('generate_fake_data', **options)
+        roots = Category.objects.filter(parent=None)
+        self.assertEqual(Category.objects.count(), 9)
+        self.assertTrue(Category.objects.filter(parent__parent__in=roots).exists())
+        self.assertEqual(UserProfile.objects.count(), 6)
+        self.assertEqual(Cart.objects.count(), 6)
+        self.assertEqual((Rating.objects.count(), Wishlist.objects.count(), ViewHistory.objects.count()),
+                         (50, 20, 30))
+        self.assertEqual(Order.objects.count(), 15)
+        for order in Order.objects.prefetch_related('items'):
+            self.assertEqual(order.total, sum(item.price * item.quantity for item in order.items.all()))
+        first = list(Order.objects.order_by('id').values_list('user__username', 'total', 'status'))
+
+        Category.objects.all().delete()
+        User.objects.all().delete()
+        call_command('generate_fake_data', **options)
+        self.assertEqual(
+            list(Order.objects.order_by('id').values_list('user__username', 'total', 'status')), first)
+
+    def test_benchmark_runs_every_scenario(self):
+        SyntheticData(seed=1).catalog(products=30, ratings=60, users=3, categories=2)
+        results = Benchmark(iterations=3, warmup=1).run()
+        self.assertEqual(list(results), SCENARIOS)
+        for result in results.values():
+            self.assertEqual(sum(result['status'].values()), 3)
+            self.assertGreater(result['queries']['p50'], 0)
+        self.assertEqual(results['checkout']['status'], {302: 3})
+        self.assertEqual(Order.objects.count(), 4)
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        clothes = Category.objects.create(name='Clothes')
+        accessories = Category.objects.create(name='Accessories')
+        self.jersey = make_product(clothes, name='Home Jersey', type='MEN', season='2024-25', color='Green')
+        self.shorts = make_product(clothes, name='Home Shorts', type='MEN', season='2024-25', color='Green')
+        self.hoodie = make_product(clothes, name='Hoodie', type='WOMEN', season='RETRO', color='Black')
+        self.scarf = make_product(accessories, name='Scarf', type='UNISEX', season='CLASSIC', color='White')
+        self.hidden = make_product(clothes, name='Old Jersey', type='MEN', season='2024-25', color='Green',
+                                   is_active=False)
+
+    def order(self, user, *products):
+        order = Order.objects.create(user=user, total=0, shipping_address='')
+        OrderItem.objects.bulk_create([OrderItem(order=order, product=product, price=1) for product in products])
+
+    def test_co_occurrence_outranks_attributes(self):
+        for i in range(3):
+            self.order(User.objects.create_user(f'fan{i}'), self.jersey, self.scarf, self.hidden)
+        build_neighbors()
+
+        ranked = list(ProductNeighbor.objects.filter(product=self.jersey).values_list('neighbor__name', flat=True))
+        # Bought together, then same attributes, then same category; inactive products never show up
+        self.assertEqual(ranked, ['Scarf', 'Home Shorts', 'Hoodie'])
+        self.assertFalse(ProductNeighbor.objects.filter(product=self.hidden).exists())
+
+    def test_product_detail_reads_the_table(self):
+        self.assertEqual(similar_products(self.scarf), [])  # no table yet: same category only
+        users = [User.objects.create_user(f'fan{i}') for i in range(2)]
+        ViewHistory.objects.bulk_create([
+            ViewHistory(user=user, product=product) for user in users for product in (self.hoodie, self.scarf)
+        ])
+        build_neighbors()
+
+        response = self.client.get(reverse('product_detail', args=[self.scarf.slug]))
+        self.assertEqual([product.name for product in response.context['similar_products']][:1], ['Hoodie'])
+
+
+@override_settings(SHOP_RANKINGS={'ORDER_LAG': 0})
+class RankingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Clothes')
+        self.jersey = make_product(category, name='Home Jersey')
+        self.scarf = make_product(category, name='Scarf')
+        self.hat = make_product(category, name='Hat')
+        self.user = User.objects.create_user('fan')
+
+    def order(self, product, quantity, created_at=None):
+        order = Order.objects.create(user=self.user, total=0, shipping_address='')
+        if created_at:
+            Order.objects.filter(id=order.id).update(created_at=created_at)
+        OrderItem.objects.create(order=order, product=product, quantity=quantity, price=1)
+
+    def test_incremental_runs(self):
+        Product.objects.filter(id=self.scarf.id).update(views=30)
+        self.order(self.hat, 1)
+        self.assertEqual(update_rankings(), 2)
+        self.assertEqual([p.name for p in trending_products()], ['Scarf', 'Hat'])
+        self.assertEqual([p.name for p in bestsellers()], ['Hat'])
+
+        # Nothing new, nothing touched
+        self.assertEqual(update_rankings(), 0)
+
+        self.order(self.jersey, 5)
+        Product.objects.filter(id=self.scarf.id).update(views=35)
+        self.assertEqual(update_rankings(), 2)
+        self.assertEqual([p.name for p in trending_products()], ['Home Jersey', 'Scarf', 'Hat'])
+        self.assertEqual(ProductRanking.objects.get(product=self.scarf).views_seen, 35)
+
+    @override_settings(SHOP_RANKINGS={'ORDER_LAG': 60})
+    def test_recent_orders_wait_for_the_lag(self):
+        now = timezone.now()
+        self.order(self.hat, 1, created_at=now - timedelta(seconds=30))
+        self.assertEqual(update_rankings(now=now), 0)
+        self.assertEqual(get_state().last_order_id, 0)
+        self.assertEqual(update_rankings(now=now + timedelta(seconds=30)), 1)
+        self.assertEqual([p.name for p in bestsellers()], ['Hat'])
+
+    def test_rebuild_recounts_every_order(self):
+        self.order(self.hat, 1)
+        self.order(self.scarf, 2)
+        update_rankings()
+        Order.objects.filter(items__product=self.scarf).update(status='CANCELLED')
+        self.assertEqual(update_rankings(rebuild=True), 1)
+        self.assertEqual([p.name for p in bestsellers()], ['Hat'])
+
+    def test_older_events_weigh_less(self):
+        now = timezone.now()
+        self.order(self.jersey, 4, created_at=now - timedelta(days=30))
+        self.order(self.scarf, 1, created_at=now)
+        update_rankings(now=now)
+        # A month is 10 trending half-lives but a single bestseller one
+        self.assertEqual([p.name for p in trending_products()], ['Scarf', 'Home Jersey'])
+        self.assertEqual([p.name for p in bestsellers()], ['Home Jersey', 'Scarf'])
+
+        later = now + timedelta(days=3 * (RESCALE_AFTER + 1))
+        update_rankings(now=later)
+        self.assertEqual(get_state().epoch, later)
+        self.assertEqual([p.name for p in bestsellers()], ['Home Jersey', 'Scarf'])
+
+    def test_home_and_command(self):
+        self.order(self.hat, 2)
+        out = StringIO()
+        call_command('update_rankings', stdout=out)
+        call_command('update_rankings', stdout=out)
+        self.assertIn('skipping', out.getvalue())
+
+        response = self.client.get(reverse('home'))
+        self.assertEqual([p.name for p in response.context['bestsellers']], ['Hat'])
+        self.assertContains(response, 'Bestsellers')
+
+
+class CatalogSyncTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Clothes')
+        self.jersey = make_product(self.category, name='Home Jersey', price=80, stock=5)
+
+    def run_import(self, text, format='csv', **kwargs):
+        importer = CatalogImporter(batch_size=2, **kwargs)
+        return importer, importer.run(read_rows(StringIO(text), format))
+
+    def test_upsert_by_slug_and_unique_slugs(self):
+        csv_text = (
+            'slug,name,category,price,stock,size,is_active\n'
+            f'{self.jersey.slug},Home Jersey 24-25,clothes,85.50,7,L,1\n'
+            ',Training Top,clothes,60,3,,yes\n'
+            ',Training Top,clothes,61,3,,yes\n'
+            ',Σημαία,clothes,15,3,,yes\n'
+            ',Scarf,accessories,20,1,,1\n'
+            ',Cap,clothes,-1,1,,1\n'
+            'Away Jersey,Away Jersey,clothes,70,1,,1\n'
+        )
+        importer, stats = self.run_import(csv_text)
+        self.assertEqual(stats, {'rows': 7, 'created': 1, 'updated': 1, 'skipped': 5})
+        self.assertEqual([line for line, _ in importer.errors], [3, 4, 5, 6, 7])
+
+        self.jersey.refresh_from_db()
+        self.assertEqual((self.jersey.name, self.jersey.price, self.jersey.stock, self.jersey.size),
+                         ('Home Jersey 24-25', Decimal('85.50'), 7, 'L'))
+        self.assertEqual(dict(Product.objects.values_list('slug', 'price')),
+                         {'home-jersey': Decimal('85.50'), 'training-top': Decimal('60')})
+        self.assertEqual([p.slug for p in get_search_backend().search(Product.objects.all(), '24-25')],
+                         ['home-jersey'])
+
+    def test_slugless_feed_upserts_on_reimport(self):
+        csv_text = 'name,category,price\nScarf,clothes,20\nScarf,clothes,21\nHome Jersey,clothes,90\n'
+        _, stats = self.run_import(csv_text)
+        self.assertEqual(stats, {'rows': 3, 'created': 1, 'updated': 1, 'skipped': 1})
+        _, stats = self.run_import(csv_text)
+        self.assertEqual(stats, {'rows': 3, 'created': 0, 'updated': 2, 'skipped': 1})
+        self.assertEqual(dict(Product.objects.values_list('slug', 'price')),
+                         {'home-jersey': Decimal('90'), 'scarf': Decimal('20')})
+
+    def test_export_import_round_trip(self):
+        make_product(self.category, name='Flag Σημαία', description='Πράσινη σημαία\nμε τριφύλλι', is_active=False)
+        for format in ('csv', 'jsonl'):
+            out = StringIO()
+            write_rows(export_rows(), out, format)
+            before = list(Product.objects.order_by('id').values())
+
+            with CaptureQueriesContext(connection) as ctx:
+                importer, stats = self.run_import(out.getvalue(), format, dry_run=True)
+            self.assertEqual(stats, {'rows': 2, 'created': 0, 'updated': 2, 'skipped': 0})
+            self.assertLessEqual(len(ctx.captured_queries), 10)
+
+            self.run_import(out.getvalue(), format)
+            after = list(Product.objects.order_by('id').values())
+            self.assertEqual([{**row, 'updated_at': None} for row in after],
+                             [{**row, 'updated_at': None} for row in before])
+
+    def test_dry_run_writes_nothing(self):
+        _, stats = self.run_import('name,category,price\nScarf,Accessories,20\n',
+                                   dry_run=True, create_categories=True)
+        self.assertEqual(stats['created'], 1)
+        self.assertFalse(Category.objects.filter(name='Accessories').exists())
+        self.assertEqual(Product.objects.count(), 1)
+
+    def test_commands(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'catalog.jsonl')
+            call_command('export_catalog', output=path, stderr=StringIO())
+            out = StringIO()
+            call_command('import_catalog', path, dry_run=True, stdout=out, stderr=StringIO())
+        self.assertIn('[dry run] 1 rows: 0 created, 1 updated, 0 skipped', out.getvalue())
+        self.assertIn('rows/s', out.getvalue())
+
+
+@override_settings(SHOP_SALES_REPORT={'ORDER_LAG': 0})
+class SalesReportTests(TestCase):
+    def setUp(self):
+        self.clothes = Category.objects.create(name='Clothes')
+        self.accessories = Category.objects.create(name='Accessories')
+        self.jersey = make_product(self.clothes, name='Home Jersey', price=80)
+        self.scarf = make_product(self.accessories, name='Scarf', price=20)
+        self.user = User.objects.create_user('fan', email='fan@example.com', password='pass12345')
+        self.staff = User.objects.create_user('staff', password='pass12345', is_staff=True)
+
+    def order(self, lines, status='PENDING', created_at=None):
+        order = Order.objects.create(user=self.user, status=status, shipping_address='Athens',
+                                     total=sum(product.price * quantity for product, quantity in lines))
+        for product, quantity in lines:
+            OrderItem.objects.create(order=order, product=product, quantity=quantity, price=product.price)
+        if created_at:
+            Order.objects.filter(pk=order.pk).update(created_at=created_at)
+        return order
+
+    @override_settings(SHOP_SALES_REPORT={'ORDER_LAG': 60})
+    def test_recent_orders_wait_for_the_lag(self):
+        now = timezone.now()
+        order = self.order([(self.jersey, 1)], created_at=now - timedelta(seconds=30))
+        self.assertEqual(refresh_sales(now=now), 0)
+        self.assertEqual(refresh_sales(now=now + timedelta(seconds=30)), 1)
+        self.assertEqual(SalesReportState.objects.get().last_order_id, order.id)
+
+    def test_incremental_refresh(self):
+        yesterday = timezone.now() - timedelta(days=1)
+        self.order([(self.jersey, 2), (self.scarf, 1)], created_at=yesterday)
+        self.order([(self.scarf, 3)], status='CANCELLED')
+        self.assertEqual(refresh_sales(), 1)
+
+        self.order([(self.jersey, 1)])
+        with self.assertNumQueries(15):
+            self.assertEqual(refresh_sales(), 1)
+        self.assertEqual(refresh_sales(), 0)
+
+        self.assertEqual(
+            [(row.date, row.orders, row.items, row.revenue) for row in DailySales.objects.all()],
+            [(timezone.localdate(), 1, 1, Decimal('80')), (timezone.localdate(yesterday), 1, 3, Decimal('180'))],
+        )
+        self.assertEqual(ProductSales.objects.get(product=self.jersey).revenue, Decimal('240'))
+        self.assertEqual(ProductSales.objects.get(product=self.scarf).items, 1)
+        self.assertEqual([(row.category, row.orders, row.revenue) for row in CategorySales.objects.all()],
+                         [(self.clothes, 2, Decimal('240')), (self.accessories, 1, Decimal('20'))])
+
+        # Cancelling after the fact needs a rebuild
+        Order.objects.filter(status='PENDING').update(status='CANCELLED')
+        self.assertEqual(refresh_sales(rebuild=True), 0)
+        self.assertFalse(DailySales.objects.exists())
+
+    def test_staff_report_and_export(self):
+        self.order([(self.jersey, 2), (self.scarf, 1)])
+        self.order([(self.scarf, 1)], status='DELIVERED', created_at=timezone.now() - timedelta(days=3))
+        self.assertEqual(self.client.get(reverse('staff_sales')).status_code, 302)
+
+        self.client.login(username='staff', password='pass12345')
+        report = self.client.get(reverse('staff_sales'), {'days': 2}).json()
+        self.assertEqual(len(report['daily']), 1)
+        self.assertEqual([row['slug'] for row in report['products']], ['home-jersey', 'scarf'])
+        self.assertEqual(report['categories'][0]['revenue'], '160.00')
+
+        response = self.client.get(reverse('staff_orders_export'), {'status': 'PENDING'})
+        self.assertTrue(response.streaming)
+        rows = list(csv.reader(line.decode() for line in response.streaming_content))
+        self.assertEqual(rows[0], EXPORT_FIELDS)
+        self.assertEqual([(row[7], row[10], row[12]) for row in rows[1:]],
+                         [('home-jersey', '2', '160.00'), ('scarf', '1', '20.00')])
+        self.assertEqual(self.client.get(reverse('staff_orders_export'), {'since': '2024-13-01'}).status_code, 400)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'orders.csv')
+            call_command('export_orders', output=path, since=timezone.localdate(), batch_size=1, stderr=StringIO())
+            with open(path, encoding='utf-8', newline='') as f:
+                self.assertEqual(len(list(csv.reader(f))), 3)
@@ -1,21 +1,38 @@
+import json
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.db.models import Q, Avg, Count
-from django.http import JsonResponse
+from django.db import transaction
+from django.http import HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
 from django.core.paginator import Paginator
-from .models import (Product, Category, Cart, CartItem, Rating,
-                     UserProfile, Wishlist, ViewHistory, Order, OrderItem)
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from .models import (Product, Category, CartItem, Rating,
+                     UserProfile, Wishlist, ViewHistory, Order)
+from .counters import view_history
 from .forms import UserRegisterForm, UserProfileForm, ProductFilterForm
+from .catalog import filter_products, supports_cursor
+from .carts import CartOperationError, SessionCart, apply_operations, get_cart
+from .context_processors import set_cart_count
+from .facets import get_facets
+from .metrics import request_metrics
+from .orders import EmptyCart, OutOfStock, place_order
+from .pagination import CursorPaginator, InvalidCursor, cached_count, cursor_querystring
+from .rankings import bestsellers, trending_products
+from .recommendations import similar_products
+from .reports import csv_stream, export_rows, order_items, sales_report
 
 
 def home(request):
     """Home Page"""
     context = {
-        'featured_products': Product.objects.filter(is_active=True).order_by('-created_at')[:8],
+        'featured_products': Product.objects.catalog().order_by('-created_at')[:8],
+        'trending_products': trending_products(),
+        'bestsellers': bestsellers(),
         'categories': Category.objects.filter(parent=None),
     }
     return render(request, 'home.html', context)
@@ -23,104 +40,60 @@ def home(request):
 
 def product_list(request):
     """Products List with filters"""
-    products = Product.objects.filter(is_active=True)
+    products, search_query, sort_by = filter_products(request.GET)
     form = ProductFilterForm(request.GET)
 
-    # Search
-    search_query = request.GET.get('search', '').strip()
-    if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(color__icontains=search_query)
-        )
-
-    # Filters
-    category_id = request.GET.get('category', '').strip()
-    if category_id:
-        products = products.filter(category_id=category_id)
-
-    min_price = request.GET.get('min_price', '').strip()
-    if min_price:
-        try:
-            products = products.filter(price__gte=float(min_price))
-        except ValueError:
-            pass
-
-    max_price = request.GET.get('max_price', '').strip()
-    if max_price:
+    # Pagination
+    cursor_mode = supports_cursor(request.GET, search_query, sort_by)
+    if cursor_mode:
+        paginator = CursorPaginator(products, sort_by, 12)
         try:
-            products = products.filter(price__lte=float(max_price))
-        except ValueError:
-            pass
-
-    size = request.GET.get('size', '').strip()
-    if size:
-        products = products.filter(size=size)
-
-    product_type = request.GET.get('type', '').strip()
-    if product_type:
-        products = products.filter(type=product_type)
-
-    season = request.GET.get('season', '').strip()
-    if season:
-        products = products.filter(season=season)
-
-    color = request.GET.get('color', '').strip()
-    if color:
-        products = products.filter(color__icontains=color)
-
-    # Sorting
-    sort_by = request.GET.get('sort_by', '').strip()
-    if sort_by == 'price_asc':
-        products = products.order_by('price')
-    elif sort_by == 'price_desc':
-        products = products.order_by('-price')
-    elif sort_by == 'name_asc':
-        products = products.order_by('name')
-    elif sort_by == 'name_desc':
-        products = products.order_by('-name')
-    elif sort_by == 'newest':
-        products = products.order_by('-created_at')
+            page_obj = paginator.get_page(request.GET.get('cursor'))
+        except InvalidCursor:
+            page_obj = paginator.get_page()
+        if page_obj.has_next():
+            page_obj.next_query = cursor_querystring(request.GET, page_obj.next_cursor)
+        if page_obj.has_previous():
+            page_obj.previous_query = cursor_querystring(request.GET, page_obj.previous_cursor)
+        result_count = cached_count(products, request.GET) if search_query else None
     else:
-        products = products.order_by('-created_at')
-
-    # Pagination
-    paginator = Paginator(products, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+        paginator = Paginator(products, 12)
+        page_number = request.GET.get('page')
+        page_obj = paginator.get_page(page_number)
+        result_count = paginator.count
 
+    categories = list(Category.objects.all())
     return render(request, 'product_list.html', {
         'page_obj': page_obj,
+        'cursor_mode': cursor_mode,
+        'result_count': result_count,
         'form': form,
         'search_query': search_query,
-        'categories': Category.objects.all(),
+        'categories': categories,
+        'facets': get_facets(request.GET, categories),
     })
 
 
 def product_detail(request, slug):
     """Product Details"""
-    product = get_object_or_404(Product, slug=slug, is_active=True)
+    product = get_object_or_404(Product.objects.select_related('category'), slug=slug, is_active=True)
     product.increment_views()
 
     if request.user.is_authenticated:
-        ViewHistory.objects.get_or_create(user=request.user, product=product)
+        view_history.add(request.user.id, product.id)
 
     ratings = product.ratings.all().order_by('-created_at')
     user_rating = ratings.filter(user=request.user).first() if request.user.is_authenticated else None
 
-    # Similar products
-    similar_products = Product.objects.filter(
-        category=product.category,
-        is_active=True
-    ).exclude(id=product.id)[:4]
+    # Similar products, precomputed by build_recommendations
+    similar = similar_products(product)
 
     return render(request, 'product_detail.html', {
         'product': product,
         'ratings': ratings,
         'user_rating': user_rating,
         'avg_rating': product.average_rating(),
-        'similar_products': similar_products,
+        'similar_products': similar,
     })
 
 
@@ -134,7 +107,6 @@ def register(request):
         if form.is_valid():
             user = form.save()
             UserProfile.objects.create(user=user)
-            Cart.objects.create(user=user)
             messages.success(request, 'Your account has been created successfully!')
             return redirect('login')
     else:
@@ -203,39 +175,54 @@ def dashboard(request):
     return render(request, 'dashboard.html', context)
 
 
-@login_required
 def cart_view(request):
-    """Cart"""
-    cart, created = Cart.objects.get_or_create(user=request.user)
-    return render(request, 'cart.html', {'cart': cart})
+    """Cart (session cart for anonymous visitors)"""
+    if request.user.is_authenticated:
+        cart = get_cart(request.user)
+    else:
+        cart = SessionCart(request.session)
+
+    if cart is None:
+        items, summary = [], {'count': 0, 'total': 0}
+    else:
+        items = cart.get_items()
+        summary = cart.get_summary(items)
+    set_cart_count(request, summary['count'])
+    return render(request, 'cart.html', {
+        'cart': cart,
+        'items': items,
+        'summary': summary,
+    })
 
 
 @csrf_exempt
 def add_to_cart(request, product_id):
     """Add to cart"""
-    # Manual έλεγχος αν είναι logged in
-    if not request.user.is_authenticated:
-        if request.method == 'POST':
-            return JsonResponse({'success': False, 'message': 'Not authenticated'}, status=401)
-        else:
-            return redirect(f'/login/?next=/cart/add/{product_id}/')
-
     if request.method != 'POST':
         return JsonResponse({'success': False, 'message': 'Invalid request'}, status=400)
 
     try:
         product = get_object_or_404(Product, id=product_id, is_active=True)
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product)
-
-        if not created:
-            cart_item.quantity += 1
-            cart_item.save()
+        if request.user.is_authenticated:
+            # The DB cart is created lazily, on the first add
+            cart = get_cart(request.user, create=True)
+            cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product)
+
+            if not created:
+                cart_item.quantity += 1
+                cart_item.save()
+            cart.invalidate_summary()
+            cart_count = cart.get_summary()['count']
+        else:
+            cart = SessionCart(request.session)
+            cart.apply_operations([{'op': 'add', 'product_id': product.id}])
+            cart_count = cart.count()
+        set_cart_count(request, cart_count)
 
         return JsonResponse({
             'success': True,
             'message': f'{product.name} added to cart!',
-            'cart_count': cart.get_items_count(),
+            'cart_count': cart_count,
         })
     except Exception as e:
         return JsonResponse({
@@ -251,7 +238,7 @@ def update_cart(request, item_id):
     if request.method != 'POST':
         return JsonResponse({'success': False, 'message': 'Invalid request'}, status=400)
 
-    cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
+    cart_item = get_object_or_404(CartItem.objects.select_related('cart', 'product'), id=item_id, cart__user=request.user)
     quantity = int(request.POST.get('quantity', 1))
 
     if quantity > 0:
@@ -260,10 +247,14 @@ def update_cart(request, item_id):
     else:
         cart_item.delete()
 
-    cart = Cart.objects.get(user=request.user)
+    cart = cart_item.cart
+    cart.invalidate_summary()
+    summary = cart.get_summary()
+    set_cart_count(request, summary['count'])
     return JsonResponse({
         'success': True,
-        'cart_total': float(cart.get_total()),
+        'cart_count': summary['count'],
+        'cart_total': float(summary['total']),
         'item_subtotal': float(cart_item.get_subtotal()) if quantity > 0 else 0,
     })
 
@@ -275,51 +266,76 @@ def remove_from_cart(request, item_id):
     if request.method != 'POST':
         return JsonResponse({'success': False, 'message': 'Invalid request'}, status=400)
 
-    cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
+    cart_item = get_object_or_404(CartItem.objects.select_related('cart'), id=item_id, cart__user=request.user)
     cart_item.delete()
 
-    cart = Cart.objects.get(user=request.user)
+    cart = cart_item.cart
+    cart.invalidate_summary()
+    summary = cart.get_summary()
+    set_cart_count(request, summary['count'])
     return JsonResponse({
         'success': True,
         'message': 'Product removed from cart',
-        'cart_count': cart.get_items_count(),
-        'cart_total': float(cart.get_total()),
+        'cart_count': summary['count'],
+        'cart_total': float(summary['total']),
+    })
+
+
+@require_POST
+def cart_batch(request):
+    """Apply several cart operations in one request (see carts.py)"""
+    try:
+        operations = json.loads(request.body)['operations']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'success': False, 'message': 'Invalid request'}, status=400)
+
+    try:
+        if request.user.is_authenticated:
+            cart = get_cart(request.user, create=True)
+            items = apply_operations(cart, operations)
+        else:
+            cart = SessionCart(request.session)
+            items = cart.apply_operations(operations)
+    except CartOperationError as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=400)
+
+    summary = cart.get_summary()
+    set_cart_count(request, summary['count'])
+    return JsonResponse({
+        'success': True,
+        'message': 'Cart updated',
+        'cart_count': summary['count'],
+        'cart_total': float(summary['total']),
+        'items': [{'id': item.id, 'product_id': item.product_id, 'quantity': item.quantity} for item in items],
     })
 
 
 @login_required
 def checkout(request):
     """Checkout"""
-    cart = get_object_or_404(Cart, user=request.user)
+    cart = get_cart(request.user)
 
-    if not cart.items.exists():
+    if cart is None or not cart.items.exists():
         messages.warning(request, 'Your cart is empty!')
         return redirect('cart')
 
     if request.method == 'POST':
-        # Order creation
-        order = Order.objects.create(
-            user=request.user,
-            total=cart.get_total(),
-            shipping_address=f"{request.user.profile.address}, {request.user.profile.city}"
-        )
-
-        # Creation of order items
-        for item in cart.items.all():
-            OrderItem.objects.create(
-                order=order,
-                product=item.product,
-                quantity=item.quantity,
-                price=item.product.price
-            )
-
-        # Clear of cart
-        cart.items.all().delete()
-
+        profile = UserProfile.objects.filter(user=request.user).first()
+        shipping_address = f"{profile.address}, {profile.city}" if profile else ''
+        try:
+            order = place_order(request.user, cart, shipping_address)
+        except EmptyCart:
+            messages.warning(request, 'Your cart is empty!')
+            return redirect('cart')
+        except OutOfStock as e:
+            messages.error(request, f'Not enough stock for: {e}')
+            return redirect('cart')
+
+        set_cart_count(request, 0)
         messages.success(request, f'Order #{order.id} completed successfully!')
         return redirect('dashboard')
 
-    return render(request, 'checkout.html', {'cart': cart})
+    return render(request, 'checkout.html', {'cart': cart, 'summary': cart.get_summary()})
 
 
 @csrf_exempt
@@ -336,17 +352,20 @@ def add_rating(request, product_id):
     if rating_value < 1 or rating_value > 5:
         return JsonResponse({'success': False, 'message': 'Invalid rating'})
 
-    rating, created = Rating.objects.update_or_create(
-        product=product,
-        user=request.user,
-        defaults={'rating': rating_value, 'review': review_text}
-    )
+    # The rating and the product aggregates (see signals.py) change together
+    with transaction.atomic():
+        rating, created = Rating.objects.update_or_create(
+            product=product,
+            user=request.user,
+            defaults={'rating': rating_value, 'review': review_text}
+        )
+    product.refresh_from_db(fields=['rating_count', 'rating_sum'])
 
     return JsonResponse({
         'success': True,
         'message': 'Your rating has been saved!',
         'avg_rating': product.average_rating(),
-        'rating_count': product.ratings.count(),
+        'rating_count': product.rating_count,
     })
 
 
@@ -373,4 +392,43 @@ def toggle_wishlist(request, product_id):
         'success': True,
         'in_wishlist': in_wishlist,
         'message': message,
-    })
\ No newline at end of file
+    })
+
+
+@user_passes_test(lambda u: u.is_staff)
+def staff_metrics(request):
+    """Per-view query count and latency windows of this process"""
+    return JsonResponse(request_metrics.snapshot())
+
+
+@user_passes_test(lambda u: u.is_staff)
+def staff_sales(request):
+    """Daily, product and category revenue, refreshed from the new orders"""
+    try:
+        days = max(1, min(int(request.GET.get('days', 30)), 366))
+        limit = max(1, min(int(request.GET.get('limit', 20)), 100))
+    except ValueError:
+        return HttpResponseBadRequest('days and limit must be numbers')
+    return JsonResponse(sales_report(days, limit))
+
+
+@user_passes_test(lambda u: u.is_staff)
+def staff_orders_export(request):
+    """Orders and their items as a streamed CSV, ?since=&until= (YYYY-MM-DD) &status="""
+    dates = {}
+    for name in ('since', 'until'):
+        value = request.GET.get(name)
+        try:
+            dates[name] = parse_date(value) if value else None
+        except ValueError:
+            dates[name] = None
+        if value and dates[name] is None:
+            return HttpResponseBadRequest(f'Invalid {name}, expected YYYY-MM-DD')
+    status = request.GET.get('status') or None
+    if status and status not in dict(Order.STATUS_CHOICES):
+        return HttpResponseBadRequest('Invalid status')
+
+    items = order_items(status=status, **dates)
+    response = StreamingHttpResponse(csv_stream(export_rows(items)), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="orders-{timezone.localdate().isoformat()}.csv"'
+    return response